@@ -0,0 +1,492 @@
+"""
+Local HTTP forecast service.
+
+Exposes the same pipeline as the Streamlit app (outlier handling, fit,
+predict, appointment / DNA adjustment and percentile thresholds) so other
+planning tools can request forecasts programmatically. Only the standard
+library is used for the server itself.
+
+Run with:
+    python forecast_service.py --port 8502 --workers 4
+
+Endpoints:
+    GET  /health     liveness check, 503 if the dispatcher or worker pool is down
+    POST /forecast   JSON body {"data": [{"ds": ..., "y": ...}, ...], "params": {...}}
+                     Optional "format": "ndjson" (default), "json" or "arrow",
+                     "holidays": [{"holiday": ..., "ds": ...}, ...] and
+                     "regressors": [{"ds": ..., "<name>": ...}, ...].
+
+Concurrent requests are collected into micro-batches; identical requests
+that are queued or running together are computed once, and the rest of the
+batch is split into one task per worker rather than one task per request.
+Fitted models are cached (by input fingerprint and model parameters) so
+repeat requests only predict.
+"""
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from functions import features
+from functions import fit_controls
+from functions import forecast_functions
+from functions import run_store
+from functions import sidebar
+from functions import validate_data
+
+
+#rows per NDJSON chunk / Arrow record batch when streaming a response
+STREAM_ROWS = 1000
+
+#numeric params a request may set: type, lower and upper bound (None if unbounded)
+#and whether the bounds themselves are allowed
+NUMERIC_PARAMS = {
+    'forecast_horizon': (int, 1, None, True),
+    'predict_chunk_size': (int, 1, None, True),
+    'demand_percentile': (float, 0, 1, False),
+    'confidence_limit': (float, 0, 1, False),
+    'dna_rate': (float, 0, 100, True),
+    'average_appointments_per_pt': (float, 0, None, False),
+    'outlier_detection_method_threshold': (float, 0, None, False),
+    'optimizer_iter': (int, 1, None, True),
+    'optimizer_tol_rel_grad': (float, 0, None, False),
+}
+
+#params a request may set from a fixed list of options
+CHOICE_PARAMS = {
+    'unit_of_measurement': list(sidebar.dict_unit_text_to_parameter_term),
+    'num_appts_per_patient': ['Single appt per patient', 'Multiple appt per patient'],
+    'outlier_detection_method': ['iqr', 'statistical'],
+    'optimizer_algorithm': fit_controls.OPTIMIZER_ALGORITHMS,
+    'fit_init': fit_controls.INIT_METHODS,
+}
+
+#---------------------------------------
+
+def parse_params(dict_request_params):
+    # Merge a request's params over the defaults, raising ValueError with a message
+    # for the caller if any are unknown, of the wrong type or out of range
+    if not isinstance(dict_request_params, dict):
+        raise ValueError("'params' must be an object.")
+    #frames come from the request's 'holidays' / 'regressors' lists, not params
+    allowed_keys = set(forecast_functions.DEFAULT_PARAMS) - {'holidays_df', 'regressors_df'}
+    unknown_keys = sorted(set(dict_request_params) - allowed_keys)
+    if unknown_keys:
+        raise ValueError(f"Unknown params {unknown_keys}. Use any of {sorted(allowed_keys)}.")
+
+    dict_params = {**forecast_functions.DEFAULT_PARAMS, **dict_request_params}
+    for key, (value_type, lower, upper, inclusive) in NUMERIC_PARAMS.items():
+        value = dict_params[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or (value_type is int and value != int(value)):
+            raise ValueError(f"'{key}' must be {'a whole number' if value_type is int else 'a number'}, not {value!r}.")
+        is_below = value < lower if inclusive else value <= lower
+        is_above = upper is not None and (value > upper if inclusive else value >= upper)
+        if is_below or is_above:
+            if inclusive:
+                bounds = f'from {lower}' + (f' to {upper}' if upper is not None else ' up')
+            else:
+                bounds = f'above {lower}' + (f' and below {upper}' if upper is not None else '')
+            raise ValueError(f"'{key}' must be {bounds}, not {value!r}.")
+        dict_params[key] = value_type(value)
+    for key, options in CHOICE_PARAMS.items():
+        if dict_params[key] not in options:
+            raise ValueError(f"'{key}' must be one of {options}, not {dict_params[key]!r}.")
+
+    #a unit sent without its pandas frequency uses the unit's own
+    if 'unit_of_measurement' in dict_request_params and 'dict_unit_text_to_parameter_term' not in dict_request_params:
+        dict_params['dict_unit_text_to_parameter_term'] = sidebar.dict_unit_text_to_parameter_term[dict_params['unit_of_measurement']]
+    return dict_params
+
+#---------------------------------------
+
+def run_forecast_job(df, dict_params, model_json=None):
+    # Executed in a pool worker. Fits the model (unless a cached fit is given),
+    # predicts the horizon and returns the future rows with the threshold summary.
+    # The fit diagnostics are None for a cached fit
+    from prophet.serialize import model_to_json, model_from_json
+
+    if model_json is None:
+        model, df_cleaned, dict_fit_diagnostics = forecast_functions.fit_forecast_model(df, dict_params)
+        model_json = model_to_json(model)
+    else:
+        model = model_from_json(model_json)
+        df_cleaned = model.history
+        dict_fit_diagnostics = None
+
+    #keep every future row, this is what is returned to the caller
+    forecast, dict_threshold_values = forecast_functions.predict_in_chunks(
+        model,
+        df_cleaned,
+        dict_params,
+        chunk_size=dict_params['predict_chunk_size'],
+        max_display_rows=max(int(dict_params['forecast_horizon']), 1),
+        feature_set=forecast_functions.build_feature_set_for_params(model.history, dict_params)
+        )
+    dict_thresholds = forecast_functions.calculate_demand_thresholds(dict_threshold_values, dict_params['demand_percentile'])
+
+    output_columns = [column for column in [
+        'ds', 'yhat', 'yhat_lower', 'yhat_upper',
+        'final_adjusted_demand', 'final_adjusted_demand_lower', 'final_adjusted_demand_upper'
+        ] if column in forecast.columns]
+    forecast_future = forecast[forecast['ds'] > model.history['ds'].max()][output_columns].reset_index(drop=True)
+
+    dict_thresholds = {key: float(value) for key, value in dict_thresholds.items()}
+    return forecast_future, dict_thresholds, model_json, dict_fit_diagnostics
+
+#---------------------------------------
+
+def run_forecast_batch(list_jobs):
+    # Executed in a pool worker. Runs a group of (df, dict_params, model_json) jobs
+    # in one task, returning (True, result) or (False, error) for each so one
+    # failing series does not fail the rest of the group
+    list_results = []
+    for df, dict_params, model_json in list_jobs:
+        try:
+            list_results.append((True, run_forecast_job(df, dict_params, model_json)))
+        except Exception as error:
+            list_results.append((False, error))
+    return list_results
+
+#---------------------------------------
+
+class ForecastBatcher:
+    """
+    Collects concurrent forecast requests into micro-batches and runs them on
+    a pool of worker processes, reusing cached model fits.
+    """
+
+    def __init__(self, max_workers=4, max_batch_size=16, max_wait_ms=20, cache_size=64):
+        self.max_workers = max_workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.requests = queue.Queue()
+        self.fit_cache = OrderedDict()
+        #futures waiting on a job already running, so repeat requests arriving
+        #in later batches do not refit the same series
+        self.in_flight = {}
+        #guards the fit cache, the in-flight jobs and the stats, which the dispatcher
+        #thread and the pool's callback threads all update
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0, 'batches': 0, 'jobs': 0, 'cache_hits': 0,
+            #totals over every model fitted, to spot slow or failing fits
+            'fits': 0, 'fits_not_converged': 0, 'fit_cmdstan_seconds': 0.0, 'fit_python_seconds': 0.0,
+            #worker pools replaced after a worker died, and why the last one broke
+            'pool_restarts': 0, 'last_pool_error': None,
+        }
+        #set while the pool is broken and could not be replaced
+        self.pool_error = None
+        self.thread = threading.Thread(target=self._collect_batches, daemon=True)
+        self.thread.start()
+
+    def submit(self, df, dict_params):
+        # Queue a request, returning a Future for (forecast, thresholds)
+        future = Future()
+        self.requests.put((df, dict_params, future))
+        return future
+
+    def _collect_batches(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception as error:
+                #keep the dispatcher alive, failing only this batch's requests
+                self._fail_futures([future for _, _, future in batch], error)
+
+    def _dispatch(self, batch):
+        # Identical requests within the batch, or already running, share a single job.
+        # The jobs left are split into one group per worker, each group sent to the
+        # pool as a single task
+        dict_jobs = {}
+        for df, dict_params, future in batch:
+            input_fingerprint = run_store.fingerprint_inputs(df, dict_params['datetime_field'], dict_params['activity_count_field'])
+            fit_key = (input_fingerprint, run_store.hash_params({key: dict_params[key] for key in forecast_functions.FIT_PARAM_KEYS}))
+            job_key = (input_fingerprint, run_store.hash_params(dict_params))
+            if job_key not in dict_jobs:
+                dict_jobs[job_key] = (df, dict_params, fit_key, [])
+            dict_jobs[job_key][3].append(future)
+
+        list_jobs = []
+        with self.lock:
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            for job_key, (df, dict_params, fit_key, futures) in dict_jobs.items():
+                if job_key in self.in_flight:
+                    self.in_flight[job_key].extend(futures)
+                    continue
+                self.in_flight[job_key] = futures
+                model_json = self.fit_cache.get(fit_key)
+                if model_json is not None:
+                    self.fit_cache.move_to_end(fit_key)
+                    self.stats['cache_hits'] += 1
+                list_jobs.append((job_key, fit_key, (df, dict_params, model_json)))
+            self.stats['jobs'] += len(list_jobs)
+
+        num_groups = min(self.max_workers, len(list_jobs))
+        for group in range(num_groups):
+            list_group = list_jobs[group::num_groups]
+            #a worker may have died since the last batch, so try once more on a new pool
+            task = None
+            for attempt in range(2):
+                pool = self.pool
+                try:
+                    task = pool.submit(run_forecast_batch, [job_args for _, _, job_args in list_group])
+                    break
+                except (BrokenProcessPool, RuntimeError) as error:
+                    self._replace_pool(pool, error)
+                    submit_error = error
+            if task is None:
+                self._complete_group(list_group, [(False, submit_error)] * len(list_group))
+                continue
+            task.add_done_callback(lambda task, list_group=list_group, pool=pool: self._complete(task, list_group, pool))
+
+    def _complete(self, task, list_group, pool):
+        try:
+            list_results = task.result()
+        except Exception as error:
+            #the worker itself failed, so every job in the group fails with it
+            if isinstance(error, BrokenProcessPool):
+                self._replace_pool(pool, error)
+            list_results = [(False, error)] * len(list_group)
+        self._complete_group(list_group, list_results)
+
+    def _complete_group(self, list_group, list_results):
+        # Hand each job's result or error to every request waiting on it
+        for (job_key, fit_key, _), (succeeded, result) in zip(list_group, list_results):
+            with self.lock:
+                futures = self.in_flight.pop(job_key, [])
+            if not succeeded:
+                for future in futures:
+                    future.set_exception(result)
+                continue
+
+            forecast_future, dict_thresholds, model_json, dict_fit_diagnostics = result
+            with self.lock:
+                if dict_fit_diagnostics is not None:
+                    self.stats['fits'] += 1
+                    self.stats['fits_not_converged'] += int(not dict_fit_diagnostics['converged'])
+                    self.stats['fit_cmdstan_seconds'] += dict_fit_diagnostics['cmdstan_seconds']
+                    self.stats['fit_python_seconds'] += dict_fit_diagnostics['python_seconds']
+                self.fit_cache[fit_key] = model_json
+                self.fit_cache.move_to_end(fit_key)
+                while len(self.fit_cache) > self.cache_size:
+                    self.fit_cache.popitem(last=False)
+
+            for future in futures:
+                future.set_result((forecast_future, dict_thresholds))
+
+    def _replace_pool(self, pool, error):
+        # Swap a broken pool for a new one. Every group that was on it reports the
+        # failure, so only the first to arrive replaces it
+        with self.lock:
+            if self.pool is not pool:
+                return
+            self.stats['pool_restarts'] += 1
+            self.stats['last_pool_error'] = f'{type(error).__name__}: {error}'
+            try:
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                self.pool_error = None
+            except Exception as restart_error:
+                self.pool_error = f'{type(restart_error).__name__}: {restart_error}'
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fail_futures(self, futures, error):
+        # Fail requests that did not get a result, along with any in-flight job they joined
+        with self.lock:
+            for job_key, job_futures in list(self.in_flight.items()):
+                if any(future in job_futures for future in futures):
+                    futures = futures + self.in_flight.pop(job_key)
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def get_stats(self):
+        # Copy of the counters, taken under the lock so they are consistent
+        with self.lock:
+            return dict(self.stats)
+
+    def get_health(self):
+        # None if requests can be served, otherwise why not
+        if not self.thread.is_alive():
+            return 'The batch dispatcher has stopped.'
+        with self.lock:
+            if self.pool_error is not None:
+                return f'The worker pool is broken and could not be restarted ({self.pool_error}).'
+        return None
+
+#---------------------------------------
+
+class _ChunkedWriter:
+    # File-like wrapper writing to the response using HTTP chunked transfer encoding
+    closed = False
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        data = bytes(data)
+        if data:
+            self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def end(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    batcher = None
+    request_timeout = 600
+
+    def do_GET(self):
+        if self.path == '/health':
+            health_error = self.batcher.get_health()
+            if health_error is None:
+                self._send_json(200, {'status': 'ok', 'stats': self.batcher.get_stats()})
+            else:
+                self._send_json(503, {'status': 'error', 'error': health_error, 'stats': self.batcher.get_stats()})
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/forecast':
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(body, dict):
+                raise ValueError('The body must be a JSON object.')
+            dict_params = parse_params(body.get('params', {}))
+            df, dict_validation_report = validate_data.validate_and_parse(
+                pd.DataFrame(body['data']),
+                dict_params['datetime_field'],
+                dict_params['activity_count_field']
+                )
+            if len(dict_validation_report['errors']) > 0:
+                raise ValueError(' '.join(dict_validation_report['errors']))
+            #optional holiday calendar and external regressors, as lists of records,
+            #checked as the app checks an uploaded file
+            for body_key, params_key, validate in [('holidays', 'holidays_df', features.validate_holidays), ('regressors', 'regressors_df', features.prepare_regressors)]:
+                if body.get(body_key):
+                    dict_params[params_key] = pd.DataFrame(body[body_key])
+                    validate(dict_params[params_key])
+            output_format = body.get('format', 'ndjson')
+            if output_format not in ['ndjson', 'json', 'arrow']:
+                raise ValueError("Unsupported format. Use 'ndjson', 'json' or 'arrow'.")
+        except (KeyError, ValueError, TypeError) as error:
+            self._send_json(400, {'error': f'Invalid request: {error}'})
+            return
+
+        try:
+            forecast_future, dict_thresholds = self.batcher.submit(df, dict_params).result(timeout=self.request_timeout)
+        except Exception as error:
+            self._send_json(500, {'error': f'Forecast failed: {error}'})
+            return
+
+        if output_format == 'json':
+            self._send_json(200, {
+                'thresholds': dict_thresholds,
+                'forecast': json.loads(forecast_future.to_json(orient='records', date_format='iso'))
+            })
+        elif output_format == 'arrow':
+            self._stream_arrow(forecast_future, dict_thresholds)
+        else:
+            self._stream_ndjson(forecast_future, dict_thresholds)
+
+    def _send_json(self, status, dict_body):
+        body = json.dumps(dict_body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type, dict_thresholds):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Demand-Thresholds', json.dumps(dict_thresholds))
+        self.end_headers()
+        return _ChunkedWriter(self.wfile)
+
+    def _stream_ndjson(self, forecast_future, dict_thresholds):
+        # First line holds the threshold summary, then one line per forecast row
+        writer = self._start_stream('application/x-ndjson', dict_thresholds)
+        writer.write((json.dumps({'thresholds': dict_thresholds}) + '\n').encode('utf-8'))
+        for start in range(0, len(forecast_future), STREAM_ROWS):
+            rows = forecast_future.iloc[start:start + STREAM_ROWS].to_json(orient='records', lines=True, date_format='iso')
+            writer.write((rows.rstrip('\n') + '\n').encode('utf-8'))
+        writer.end()
+
+    def _stream_arrow(self, forecast_future, dict_thresholds):
+        # Arrow IPC stream, with the threshold summary held in the schema metadata
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self._send_json(400, {'error': "The 'arrow' format requires pyarrow to be installed."})
+            return
+
+        table = pa.Table.from_pandas(forecast_future, preserve_index=False)
+        schema = table.schema.with_metadata({'thresholds': json.dumps(dict_thresholds)})
+        writer = self._start_stream('application/vnd.apache.arrow.stream', dict_thresholds)
+        with pa.ipc.new_stream(writer, schema) as stream:
+            for record_batch in table.to_batches(max_chunksize=STREAM_ROWS):
+                stream.write_batch(record_batch)
+        writer.end()
+
+#---------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HTTP forecast service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker processes fitting models.')
+    parser.add_argument('--max-batch-size', type=int, default=16, help='Maximum requests collected into one batch.')
+    parser.add_argument('--max-wait-ms', type=float, default=20, help='How long to wait for a batch to fill.')
+    parser.add_argument('--cache-size', type=int, default=64, help='Number of fitted models kept in the cache.')
+    args = parser.parse_args()
+
+    ForecastRequestHandler.batcher = ForecastBatcher(
+        max_workers=args.workers,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        cache_size=args.cache_size
+        )
+    server = ThreadingHTTPServer((args.host, args.port), ForecastRequestHandler)
+    print(f'Forecast service listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ForecastRequestHandler.batcher.pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from functions import run_store
+
+
+#recent errors count for more in the rolling statistics, halving in weight every this many periods
+ROLLING_HALFLIFE = 30
+
+#series are only flagged once they have this many scored periods
+MIN_PERIODS_TO_FLAG = 5
+
+#stored forecasts never change, so the future periods of this many runs are kept in memory
+FORECAST_CACHE_SIZE = 10000
+_forecast_cache = OrderedDict()
+
+#parquet files read at once when loading forecasts
+READ_WORKERS = 8
+
+#running totals kept per series and run, so each update only touches the new actuals
+STATE_COLUMNS = [
+    'num_periods',
+    'sum_error',
+    'sum_abs_error',
+    'sum_squared_error',
+    'sum_abs_actual',
+    'num_within_interval',
+    'num_over_threshold',
+    'rolling_weight',
+    'rolling_abs_error',
+    'rolling_error',
+    'rolling_within_interval',
+]
+
+#---------------------------------------
+
+def connect(store_dir=run_store.DEFAULT_STORE_DIR):
+    # Open the run store, adding the accuracy table on first use
+    conn = run_store.connect(store_dir)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS accuracy (
+            series_name TEXT NOT NULL,
+            run_id TEXT NOT NULL,
+            demand_percentile REAL,
+            confidence_limit REAL,
+            last_ds TEXT NOT NULL,
+            updated_time TEXT NOT NULL,
+            {', '.join(f'{column} REAL NOT NULL' for column in STATE_COLUMNS)},
+            PRIMARY KEY (series_name, run_id)
+        )
+    """)
+    return conn
+
+def load_state(store_dir=run_store.DEFAULT_STORE_DIR):
+    # Running totals of every series and run monitored so far
+    with closing(connect(store_dir)) as conn:
+        df_state = pd.read_sql_query('SELECT * FROM accuracy', conn)
+    df_state['last_ds'] = pd.to_datetime(df_state['last_ds'])
+    return df_state
+
+def save_state(df_state, store_dir=run_store.DEFAULT_STORE_DIR):
+    columns = ['series_name', 'run_id', 'demand_percentile', 'confidence_limit', 'last_ds', 'updated_time'] + STATE_COLUMNS
+    df_state = df_state[columns].assign(last_ds=df_state['last_ds'].dt.strftime('%Y-%m-%dT%H:%M:%S'))
+    with closing(connect(store_dir)) as conn, conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO accuracy ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            df_state.itertuples(index=False, name=None)
+        )
+
+#---------------------------------------
+
+def read_future_forecast(forecast_path, data_path):
+    # Arrays of the forecast periods after the history of a stored run (the fitted
+    # history is stored alongside). Read straight from parquet, as this runs per series
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(forecast_path, columns=['ds', 'yhat', 'yhat_lower', 'yhat_upper'])
+    if data_path is not None and os.path.exists(data_path):
+        last_history_date = pc.max(pq.read_table(data_path, columns=['ds']).column('ds'))
+        table = table.filter(pc.greater(table.column('ds'), last_history_date))
+    return {column: table.column(column).to_numpy() for column in table.column_names}
+
+def load_latest_forecasts(series_names=None, store_dir=run_store.DEFAULT_STORE_DIR):
+    """
+    Future periods of the most recent stored run of each series.
+
+    Parameters:
+    series_names : list, optional
+        Series to load, every stored series if None.
+    store_dir : str
+        Folder holding the run store.
+
+    Returns:
+    df_forecasts : pandas.DataFrame
+        One row per series and future date: 'series_name', 'run_id', 'ds',
+        'yhat', 'yhat_lower', 'yhat_upper', the planned 'demand_threshold',
+        'demand_percentile' and 'confidence_limit'. The threshold is the
+        forecast demand at the chosen percentile, as saved with the run.
+    """
+    df_runs = run_store.list_runs(store_dir=store_dir).drop_duplicates(subset='series_name', keep='first')
+    if series_names is not None:
+        df_runs = df_runs[df_runs['series_name'].isin(series_names)]
+
+    with closing(run_store.connect(store_dir)) as conn:
+        dict_run_files = {row[0]: row[1:] for row in conn.execute('SELECT run_id, forecast_path, data_path, params_json FROM runs')}
+    list_params = [json.loads(dict_run_files[run_id][2]) for run_id in df_runs['run_id']]
+
+    #read the runs not already cached, several files at a time
+    runs_to_read = [run_id for run_id in df_runs['run_id'] if run_id not in _forecast_cache]
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        list_read = list(executor.map(lambda run_id: read_future_forecast(*dict_run_files[run_id][:2]), runs_to_read))
+    for run_id, dict_arrays in zip(runs_to_read, list_read):
+        _forecast_cache[run_id] = dict_arrays
+    list_arrays = []
+    for run_id in df_runs['run_id']:
+        _forecast_cache.move_to_end(run_id)
+        list_arrays.append(_forecast_cache[run_id])
+    while len(_forecast_cache) > FORECAST_CACHE_SIZE:
+        _forecast_cache.popitem(last=False)
+
+    #build one frame for every series at once, repeating each run's details over its periods
+    num_periods = np.array([len(dict_arrays['ds']) for dict_arrays in list_arrays], dtype=int)
+    demand_percentiles = df_runs['demand_percentile'].values.astype(float)
+
+    #the planned threshold is the percentile of forecast demand saved with the run, which
+    #demand should exceed in the planned share of periods. For a multiple appt service
+    #that is in appointments, not the units of the actuals, so the same percentile is
+    #taken of the stored forecast instead
+    demand_thresholds = df_runs['demand_threshold'].values.astype(float)
+    for i, (dict_arrays, dict_run_params) in enumerate(zip(list_arrays, list_params)):
+        if dict_run_params.get('num_appts_per_patient', 'Single appt per patient') != 'Single appt per patient' or np.isnan(demand_thresholds[i]):
+            demand_thresholds[i] = np.percentile(dict_arrays['yhat'], demand_percentiles[i] * 100) if len(dict_arrays['yhat']) > 0 else np.nan
+    df_forecasts = pd.DataFrame({
+        'series_name': np.repeat(df_runs['series_name'].values, num_periods),
+        'run_id': np.repeat(df_runs['run_id'].values, num_periods),
+        **{
+            column: np.concatenate([dict_arrays[column] for dict_arrays in list_arrays]) if len(list_arrays) > 0 else np.array([], dtype=float)
+            for column in ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+        },
+        'demand_threshold': np.repeat(demand_thresholds, num_periods),
+        'demand_percentile': np.repeat(demand_percentiles, num_periods),
+        'confidence_limit': np.repeat([dict_run_params.get('confidence_limit') for dict_run_params in list_params], num_periods),
+    })
+    df_forecasts['ds'] = pd.to_datetime(df_forecasts['ds'])
+    return df_forecasts
+
+#---------------------------------------
+
+def make_keys(series_codes, date_codes):
+    # One sortable int64 per series and date: the series code in the high 32 bits,
+    # the date's position among the sorted dates in the low 32 bits (both non-negative)
+    return (np.asarray(series_codes, dtype=np.int64) << 32) | np.asarray(date_codes, dtype=np.int64)
+
+def match_actuals(df_actuals, df_forecasts):
+    """
+    Match actuals to forecasts of the same series and date, for every series
+    in one pass: both sides are reduced to int64 keys and the actuals looked
+    up in the sorted forecast keys.
+
+    Parameters:
+    df_actuals : pandas.DataFrame
+        'series_name', 'ds' and 'y' columns.
+    df_forecasts : pandas.DataFrame
+        From load_latest_forecasts.
+
+    Returns:
+    df_matched : pandas.DataFrame
+        The forecast rows with an actual 'y', sorted by series and date.
+    num_unmatched : int
+        Actuals dated from the start of their series' forecast (or of a
+        series with no stored forecast) that have no forecast for their
+        date, e.g. past the horizon or off the forecast's frequency. These
+        are left out of df_matched.
+    """
+    series_codes, _ = pd.factorize(pd.concat([df_forecasts['series_name'], df_actuals['series_name']], ignore_index=True))
+    date_codes, _ = pd.factorize(pd.concat([df_forecasts['ds'], df_actuals['ds']], ignore_index=True), sort=True)
+    forecast_keys = make_keys(series_codes[:len(df_forecasts)], date_codes[:len(df_forecasts)])
+    actual_keys = make_keys(series_codes[len(df_forecasts):], date_codes[len(df_forecasts):])
+
+    sort_order = np.argsort(forecast_keys, kind='stable')
+    sorted_keys = np.append(forecast_keys[sort_order], np.iinfo(np.int64).max)
+    #a sentinel past the last key keeps every looked up position in range
+    positions = np.searchsorted(sorted_keys, actual_keys)
+    is_match = sorted_keys[positions] == actual_keys
+    #actuals before the forecast starts are history, not missed forecasts
+    first_forecast_ds = df_actuals['series_name'].map(df_forecasts.groupby('series_name')['ds'].min())
+    num_unmatched = int((~is_match & ~(df_actuals['ds'] < first_forecast_ds).values).sum())
+
+    df_matched = df_forecasts.iloc[sort_order[positions[is_match]]].reset_index(drop=True)
+    df_matched['y'] = df_actuals['y'].values[is_match]
+    df_matched['key'] = actual_keys[is_match]
+    #an actual sent twice is only scored once
+    df_matched = df_matched.drop_duplicates(subset='key', keep='last').sort_values('key', kind='stable')
+    return df_matched.drop(columns='key').reset_index(drop=True), num_unmatched
+
+#---------------------------------------
+
+def update_accuracy(df_actuals, store_dir=run_store.DEFAULT_STORE_DIR, halflife=ROLLING_HALFLIFE):
+    """
+    Score newly arrived actuals against the latest stored forecast of each
+    series, and fold them into the running accuracy statistics. Only actuals
+    dated after the last one scored for a series and run are used, so
+    history is never rescanned.
+
+    Parameters:
+    df_actuals : pandas.DataFrame
+        'series_name', 'ds' and 'y' columns, for any number of series.
+    store_dir : str
+        Folder holding the run store.
+    halflife : float
+        Periods over which the weight of an error halves in the rolling
+        statistics.
+
+    Returns:
+    df_summary : pandas.DataFrame
+        Accuracy of every monitored series and run, see summarise_accuracy.
+    num_scored : int
+        Number of new actuals scored.
+    num_unmatched : int
+        Number of actuals with no stored forecast to score against, see
+        match_actuals.
+    """
+    df_actuals = df_actuals.dropna(subset=['series_name', 'ds', 'y']).reset_index(drop=True)
+    df_forecasts = load_latest_forecasts(df_actuals['series_name'].unique(), store_dir)
+    df_matched, num_unmatched = match_actuals(df_actuals, df_forecasts)
+
+    #drop actuals already scored
+    df_state = load_state(store_dir).set_index(['series_name', 'run_id'])
+    last_ds = df_state['last_ds'].reindex(pd.MultiIndex.from_frame(df_matched[['series_name', 'run_id']]))
+    df_new = df_matched[~(df_matched['ds'].values <= last_ds.values)].reset_index(drop=True)
+    if len(df_new) == 0:
+        return summarise_accuracy(df_state.reset_index()), 0, num_unmatched
+
+    errors = df_new['yhat'].values - df_new['y'].values
+    df_new['error'] = errors
+    df_new['abs_error'] = np.abs(errors)
+    df_new['squared_error'] = errors ** 2
+    df_new['abs_actual'] = np.abs(df_new['y'].values)
+    df_new['within_interval'] = ((df_new['y'] >= df_new['yhat_lower']) & (df_new['y'] <= df_new['yhat_upper'])).astype(float)
+    df_new['over_threshold'] = (df_new['y'] > df_new['demand_threshold']).astype(float)
+
+    #exponentially weighted statistics: each new period decays the existing state by
+    #decay, so a batch of k periods decays it by decay ** k and weights the j-th new
+    #period by decay ** (k - 1 - j)
+    decay = 0.5 ** (1 / halflife)
+    group_keys = ['series_name', 'run_id']
+    periods_from_end = df_new.groupby(group_keys, sort=False).cumcount(ascending=False).values
+    df_new['weight'] = (1 - decay) * decay ** periods_from_end
+    df_new['weighted_abs_error'] = df_new['weight'] * df_new['abs_error']
+    df_new['weighted_error'] = df_new['weight'] * df_new['error']
+    df_new['weighted_within_interval'] = df_new['weight'] * df_new['within_interval']
+
+    df_batch = df_new.groupby(group_keys).agg(
+        demand_percentile=('demand_percentile', 'first'),
+        confidence_limit=('confidence_limit', 'first'),
+        last_ds=('ds', 'max'),
+        num_periods=('ds', 'size'),
+        sum_error=('error', 'sum'),
+        sum_abs_error=('abs_error', 'sum'),
+        sum_squared_error=('squared_error', 'sum'),
+        sum_abs_actual=('abs_actual', 'sum'),
+        num_within_interval=('within_interval', 'sum'),
+        num_over_threshold=('over_threshold', 'sum'),
+        rolling_weight=('weight', 'sum'),
+        rolling_abs_error=('weighted_abs_error', 'sum'),
+        rolling_error=('weighted_error', 'sum'),
+        rolling_within_interval=('weighted_within_interval', 'sum'),
+    )
+
+    df_previous = df_state.reindex(df_batch.index)
+    df_previous[STATE_COLUMNS] = df_previous[STATE_COLUMNS].infer_objects(copy=False).fillna(0.0)
+    batch_decay = decay ** df_batch['num_periods'].values[:, None]
+    rolling_columns = [column for column in STATE_COLUMNS if column.startswith('rolling_')]
+    total_columns = [column for column in STATE_COLUMNS if not column.startswith('rolling_')]
+
+    df_updated = df_batch.copy()
+    df_updated[total_columns] = df_previous[total_columns].values + df_batch[total_columns].values
+    df_updated[rolling_columns] = batch_decay * df_previous[rolling_columns].values + df_batch[rolling_columns].values
+    df_updated['updated_time'] = datetime.now().isoformat(timespec='seconds')
+    df_updated = df_updated.reset_index()
+    save_state(df_updated, store_dir)
+
+    df_unchanged = df_state.drop(index=df_batch.index, errors='ignore').reset_index()
+    df_state = pd.concat([df for df in [df_unchanged, df_updated] if len(df) > 0], ignore_index=True)
+    return summarise_accuracy(df_state), len(df_new), num_unmatched
+
+#---------------------------------------
+
+def summarise_accuracy(df_state):
+    """
+    Accuracy statistics and flags from the running totals (from load_state,
+    or as returned by update_accuracy).
+
+    Returns:
+    df_summary : pandas.DataFrame
+        Per series and run: periods scored, mean absolute error, weighted
+        absolute percentage error, bias and interval coverage (overall and
+        rolling), the share of periods over the planned threshold, and
+        'flag_over_threshold' where demand has exceeded the planned
+        percentile more often than planned.
+    """
+    df_summary = df_state[['series_name', 'run_id', 'last_ds', 'num_periods']].copy()
+    num_periods = np.maximum(df_state['num_periods'].values, 1)
+    rolling_weight = np.where(df_state['rolling_weight'].values > 0, df_state['rolling_weight'].values, np.nan)
+
+    df_summary['mae'] = df_state['sum_abs_error'].values / num_periods
+    df_summary['rmse'] = np.sqrt(df_state['sum_squared_error'].values / num_periods)
+    df_summary['wape'] = df_state['sum_abs_error'].values / np.maximum(df_state['sum_abs_actual'].values, 1e-9)
+    df_summary['bias'] = df_state['sum_error'].values / num_periods
+    df_summary['interval_coverage'] = df_state['num_within_interval'].values / num_periods
+    #rolling statistics are normalised by their total weight, so they are unbiased early on
+    df_summary['rolling_mae'] = df_state['rolling_abs_error'].values / rolling_weight
+    df_summary['rolling_bias'] = df_state['rolling_error'].values / rolling_weight
+    df_summary['rolling_interval_coverage'] = df_state['rolling_within_interval'].values / rolling_weight
+
+    df_summary['share_over_threshold'] = df_state['num_over_threshold'].values / num_periods
+    df_summary['planned_share_over_threshold'] = 1 - df_state['demand_percentile'].values
+    df_summary['confidence_limit'] = df_state['confidence_limit'].values
+    df_summary['flag_over_threshold'] = (
+        (df_summary['num_periods'] >= MIN_PERIODS_TO_FLAG)
+        & (df_summary['share_over_threshold'] > df_summary['planned_share_over_threshold'])
+    )
+    return df_summary.sort_values(['flag_over_threshold', 'wape'], ascending=[False, False]).reset_index(drop=True)
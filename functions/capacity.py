@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from functions import plots
+from functions import forecast_functions
+
+
+#percentiles the capacity-versus-risk curve is drawn over
+CURVE_PERCENTILES = np.arange(1, 101)
+
+#---------------------------------------
+
+def prepare_demand(demand):
+    """
+    Sort the forecast demand of every series once, so capacity at any
+    percentile (and the risk that goes with it) can be read off without
+    touching the forecast again. The capacity-versus-risk curve is worked out
+    here too, so the planner's sliders never recompute it.
+
+    Parameters:
+    demand : numpy.ndarray
+        Forecast demand per period, shape (num_series, forecast_horizon).
+        For a multiple appt service this should already be adjusted for
+        appointments and DNAs (final_adjusted_demand).
+
+    Returns:
+    dict_demand : dict
+        'sorted' demand per series, its running totals 'cumulative' (with a
+        leading zero column) and the 'curve' at CURVE_PERCENTILES, as per
+        evaluate_capacity.
+    """
+    demand = np.atleast_2d(np.asarray(demand, dtype=float))
+    sorted_demand = np.sort(demand, axis=1)
+    cumulative = np.zeros((sorted_demand.shape[0], sorted_demand.shape[1] + 1))
+    np.cumsum(sorted_demand, axis=1, out=cumulative[:, 1:])
+    dict_demand = {'demand': demand, 'sorted': sorted_demand, 'cumulative': cumulative}
+    dict_demand['curve'] = evaluate_capacity(dict_demand, CURVE_PERCENTILES)
+    return dict_demand
+
+#---------------------------------------
+
+def evaluate_capacity(dict_demand, percentiles):
+    """
+    Capacity set at each percentile of demand, and the risk of running short,
+    for every series at once.
+
+    Parameters:
+    dict_demand : dict
+        From prepare_demand.
+    percentiles : array-like
+        Percentiles (0-100) to set capacity at.
+
+    Returns:
+    dict_risk : dict
+        Arrays of shape (num_percentiles, num_series): 'capacity' (demand
+        covered per period), 'share_periods_short' (share of periods demand
+        exceeds capacity), 'mean_shortfall' (unmet demand per period) and
+        'mean_idle' (unused capacity per period).
+    """
+    sorted_demand = dict_demand['sorted']
+    cumulative = dict_demand['cumulative']
+    num_series, horizon = sorted_demand.shape
+    percentiles = np.atleast_1d(np.asarray(percentiles, dtype=float))
+
+    #linear interpolation between order statistics, as np.percentile does
+    position = percentiles / 100 * (horizon - 1)
+    lower_position = np.floor(position).astype(int)
+    upper_position = np.minimum(lower_position + 1, horizon - 1)
+    fraction = (position - lower_position)[:, None]
+    capacity = sorted_demand[:, lower_position].T * (1 - fraction) + sorted_demand[:, upper_position].T * fraction
+
+    #sorted values after lower_position are all >= capacity, those up to it are <= capacity,
+    #so shortfall and idle capacity come straight from the running totals
+    num_above = horizon - 1 - lower_position[:, None]
+    total_above = cumulative[:, -1][None, :] - cumulative[:, lower_position + 1].T
+    total_below = cumulative[:, lower_position + 1].T
+    mean_shortfall = (total_above - capacity * num_above) / horizon
+    mean_idle = (capacity * (lower_position[:, None] + 1) - total_below) / horizon
+
+    #count of periods strictly above capacity, for every series in one search: each
+    #series is shifted clear of the one before, so the flattened sorted demand stays
+    #sorted and a series' capacities only land among its own values
+    if sorted_demand.size > 0:
+        series_shift = (np.arange(num_series) * (sorted_demand[:, -1].max() - sorted_demand[:, 0].min() + 1))[:, None]
+        shifted_demand = (sorted_demand + series_shift).ravel()
+        num_at_or_below = np.searchsorted(shifted_demand, capacity + series_shift.T, side='right') - np.arange(num_series) * horizon
+        share_periods_short = (horizon - num_at_or_below) / horizon
+    else:
+        share_periods_short = np.zeros_like(capacity)
+
+    return {
+        'capacity': capacity,
+        'share_periods_short': share_periods_short,
+        'mean_shortfall': mean_shortfall,
+        'mean_idle': mean_idle,
+    }
+
+#---------------------------------------
+
+def convert_to_staffing(demand, slot_minutes, session_hours, sessions_per_clinician, leave_rate, overbooking_rate, demand_dna_rate=0.0):
+    """
+    Turn demand (appointments per period) into slots, clinic sessions,
+    clinician hours and whole time equivalent clinicians. Works element-wise,
+    so demand can be a single value, every period of the horizon or a matrix
+    of series by period.
+
+    Parameters:
+    demand : numpy.ndarray
+        Appointments needed per period. For a multiple appt service this is
+        final_adjusted_demand, which counts attended appointments, so the
+        DNAs taken out of it are added back to get the bookings.
+    slot_minutes : float
+        Length of an appointment slot.
+    session_hours : float
+        Length of a clinic session.
+    sessions_per_clinician : float
+        Clinic sessions one clinician runs per period.
+    leave_rate : float
+        Share of clinician time lost to leave (0-1).
+    overbooking_rate : float
+        Share of extra patients booked into each clinic to cover DNAs (0-1).
+        Overbooking by 10% means 11 patients are booked for every 10 slots.
+    demand_dna_rate : float
+        DNA rate (0-1) already taken out of demand by
+        adjust_forecast_for_appointments, 0 if demand counts bookings.
+
+    Returns:
+    dict_staffing : dict
+        'slots', 'sessions', 'clinician_hours' and 'clinicians' arrays.
+    """
+    slots_per_session = max(int(session_hours * 60 // slot_minutes), 1)
+    bookings = np.asarray(demand, dtype=float).clip(min=0) / (1 - demand_dna_rate)
+    slots = np.ceil(bookings / (1 + overbooking_rate))
+    sessions = np.ceil(slots / slots_per_session)
+    clinician_hours = sessions * session_hours / (1 - leave_rate)
+    clinicians = sessions / (sessions_per_clinician * (1 - leave_rate))
+    return {'slots': slots, 'sessions': sessions, 'clinician_hours': clinician_hours, 'clinicians': clinicians}
+
+#---------------------------------------
+
+@st.experimental_fragment
+def render_capacity_planner(dict_demand, series_names, future_dates, default_percentile, unit_of_measurement, dna_rate=0.0, demand_net_of_dnas=False):
+    # Capacity planning controls and outputs. Runs as a fragment and everything is
+    # read off the prepared demand, so moving a slider only reruns the planner -
+    # the model is never refitted or repredicted.
+    # dna_rate (0-1) is the service's DNA rate, which overbooking defaults to, and
+    # demand_net_of_dnas says whether it was already taken out of the demand
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        slot_minutes = st.number_input(label='Appointment slot length (minutes)', min_value=5, max_value=240, value=30, step=5)
+        session_hours = st.number_input(label='Clinic session length (hours)', min_value=0.5, max_value=12.0, value=3.5, step=0.5)
+    with col2:
+        sessions_per_clinician = st.number_input(label=f'Sessions per clinician per {unit_of_measurement}', min_value=0.1, value=1.0 if unit_of_measurement in ['day', 'hour', 'minute', 'second'] else 8.0, step=0.1)
+        leave_rate = st.slider(label='Clinician time lost to leave (%)', min_value=0, max_value=50, value=15) / 100
+    with col3:
+        overbooking_rate = st.slider(
+            label='Clinic overbooking to cover DNAs (%)',
+            min_value=0, max_value=99, value=int(round(dna_rate * 100)),
+            help="Defaults to the DNA rate, so most of the slots DNAs would leave empty are filled. Set to 0 to give every booking its own slot.") / 100
+        capacity_percentile = st.slider(label='Plan capacity at percentile of demand', min_value=1, max_value=100, value=int(round(default_percentile * 100)))
+
+    dict_staffing_params = {
+        'slot_minutes': slot_minutes,
+        'session_hours': session_hours,
+        'sessions_per_clinician': sessions_per_clinician,
+        'leave_rate': leave_rate,
+        'overbooking_rate': overbooking_rate,
+        'demand_dna_rate': dna_rate if demand_net_of_dnas else 0.0,
+    }
+
+    #the whole capacity-versus-risk curve, for every series, worked out by prepare_demand
+    dict_curve = dict_demand['curve']
+    dict_curve_staffing = convert_to_staffing(dict_curve['capacity'], **dict_staffing_params)
+
+    #the plan at the chosen percentile
+    row = capacity_percentile - 1
+    dict_plan_staffing = {key: values[row] for key, values in dict_curve_staffing.items()}
+    df_plan = pd.DataFrame({
+        'series': series_names,
+        'demand_covered': dict_curve['capacity'][row],
+        'slots': dict_plan_staffing['slots'],
+        'sessions': dict_plan_staffing['sessions'],
+        'clinician_hours': dict_plan_staffing['clinician_hours'],
+        'clinicians_wte': dict_plan_staffing['clinicians'],
+        'share_periods_short': dict_curve['share_periods_short'][row],
+        'mean_shortfall': dict_curve['mean_shortfall'][row],
+        'mean_idle': dict_curve['mean_idle'][row],
+    })
+    st.write(f'Capacity needed per {unit_of_measurement} to cover the {forecast_functions.format_percentile(capacity_percentile / 100)} percentile of forecast demand:')
+    st.dataframe(df_plan, use_container_width=True)
+
+    selected_series = series_names[0] if len(series_names) == 1 else st.selectbox(label='Series to chart', options=list(series_names))
+    series_position = list(series_names).index(selected_series)
+
+    df_curve = pd.DataFrame({
+        'percentile': CURVE_PERCENTILES,
+        'sessions': dict_curve_staffing['sessions'][:, series_position],
+        'clinicians_wte': dict_curve_staffing['clinicians'][:, series_position],
+        'share_periods_short': dict_curve['share_periods_short'][:, series_position],
+        'mean_shortfall': dict_curve['mean_shortfall'][:, series_position],
+    })
+
+    #sessions needed in every period of the horizon
+    dict_period_staffing = convert_to_staffing(dict_demand['demand'][series_position], **dict_staffing_params)
+    df_periods = pd.DataFrame({
+        'ds': future_dates,
+        'sessions_needed': dict_period_staffing['sessions'],
+        'sessions_planned': dict_plan_staffing['sessions'][series_position],
+    })
+
+    tab1, tab2 = st.tabs(['Capacity versus risk', 'Sessions needed per period'])
+    with tab1:
+        st.altair_chart(plots.plot_capacity_risk_curve(df_curve, capacity_percentile), use_container_width=True)
+        st.write("""Each point is a level of capacity (clinic sessions per period) and the share of forecast periods in
+        which demand would exceed it. Moving right buys down the risk of running short, at the cost of more idle capacity.""")
+    with tab2:
+        st.altair_chart(plots.plot_sessions_per_period(df_periods), use_container_width=True)
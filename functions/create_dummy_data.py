@@ -1,14 +1,43 @@
-import numpy as np
-import pandas as pd
-
-
-def create_data():
-    np.random.seed(42)
-    # Example Data Preparation
-    data = {
-        'ds': pd.date_range(start='2020-01-01', periods=(3*365), freq='D'),
-        'y': np.random.poisson(lam=50, size=(3*365))  # Simulating daily patient numbers
-    }
-    df = pd.DataFrame(data)
-
-    return df
\ No newline at end of file
+import numpy as np
+import pandas as pd
+
+
+def create_data(num_days=3*365):
+    np.random.seed(42)
+    # Example Data Preparation
+    data = {
+        'ds': pd.date_range(start='2020-01-01', periods=num_days, freq='D'),
+        'y': np.random.poisson(lam=50, size=num_days)  # Simulating daily patient numbers
+    }
+    df = pd.DataFrame(data)
+
+    return df
+
+def create_hierarchical_data():
+    np.random.seed(42)
+    # Example trust > specialty > clinic hierarchy, with daily activity per clinic
+    df_hierarchy = pd.DataFrame({
+        'trust': ['Trust'] * 6,
+        'specialty': ['Cardiology', 'Cardiology', 'Cardiology', 'Dermatology', 'Dermatology', 'Dermatology'],
+        'clinic': ['Cardiology clinic 1', 'Cardiology clinic 2', 'Cardiology clinic 3', 'Dermatology clinic 1', 'Dermatology clinic 2', 'Dermatology clinic 3']
+    })
+
+    dates = pd.date_range(start='2022-01-01', periods=365, freq='D')
+    list_clinic_data = []
+    for clinic_number, clinic in enumerate(df_hierarchy['clinic']):
+        list_clinic_data.append(pd.DataFrame({
+            'ds': dates,
+            'clinic': clinic,
+            'y': np.random.poisson(lam=10 + 5 * clinic_number, size=len(dates))  # Simulating daily patient numbers
+        }))
+    df_long = pd.concat(list_clinic_data, ignore_index=True)
+
+    return df_long, df_hierarchy
+
+def create_actuals(num_history_days=3*365, num_new_days=90):
+    # Activity for the days after the test data, as if newly arrived. Same seed as
+    # create_data, so it carries on from the test data series
+    df_actuals = create_data(num_days=num_history_days + num_new_days).iloc[num_history_days:].reset_index(drop=True)
+    df_actuals.insert(0, 'series_name', 'Test data')
+
+    return df_actuals
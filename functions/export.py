@@ -0,0 +1,230 @@
+import io
+import os
+import tempfile
+
+import pandas as pd
+import streamlit as st
+
+
+EXPORT_FORMATS = {
+    'CSV': {'extension': 'csv', 'mime': 'text/csv'},
+    'Parquet': {'extension': 'parquet', 'mime': 'application/octet-stream'},
+    'Excel': {'extension': 'xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+}
+
+#columns selected for export until the user chooses others
+DEFAULT_EXPORT_COLUMNS = [
+    'ds',
+    'yhat',
+    'yhat_lower',
+    'yhat_upper',
+    'final_adjusted_demand',
+    'final_adjusted_demand_lower',
+    'final_adjusted_demand_upper',
+]
+
+#rows per parquet row group / csv write
+EXPORT_CHUNK_ROWS = 50000
+
+#stored forecast exports kept in memory, one per run, format and column choice
+EXPORT_CACHE_ENTRIES = 8
+
+#excel's limit on rows per sheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+
+#---------------------------------------
+
+class ExportWriter:
+    """
+    Writes a forecast to CSV, Parquet or Excel one chunk at a time, so large
+    or many-series outputs are never held in memory as a single frame.
+
+    Parameters:
+    target : str or file-like
+        Path or binary buffer to write to.
+    export_format : str
+        One of 'CSV', 'Parquet' or 'Excel'.
+    columns : list, optional
+        Columns to export. Columns missing from a chunk are skipped, all
+        columns are written if None.
+    sheet_name : str
+        Name of the worksheet when writing Excel.
+    """
+
+    def __init__(self, target, export_format, columns=None, sheet_name='forecast'):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format. Use one of {list(EXPORT_FORMATS)}.")
+        self.target = target
+        self.export_format = export_format
+        self.columns = columns
+        self.sheet_name = sheet_name
+        self.num_rows = 0
+        self._output_columns = None
+        self._writer = None
+        self._sheet = None
+        self._sheet_rows = 0
+        self._num_sheets = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, frame):
+        # Append a chunk of rows to the export
+        if self._output_columns is None:
+            #fix the columns on the first chunk so every chunk lines up
+            self._output_columns = [column for column in (self.columns or frame.columns) if column in frame.columns]
+        frame = frame.reindex(columns=self._output_columns)
+
+        if self.export_format == 'CSV':
+            self._write_csv(frame)
+        elif self.export_format == 'Parquet':
+            self._write_parquet(frame)
+        else:
+            self._write_excel(frame)
+
+        self.num_rows += len(frame)
+
+    def _write_csv(self, frame):
+        write_header = self._writer is None
+        if self._writer is None:
+            if isinstance(self.target, str):
+                self._writer = open(self.target, 'w', newline='', encoding='utf-8')
+            else:
+                self._writer = io.TextIOWrapper(self.target, encoding='utf-8', newline='')
+        frame.to_csv(self._writer, header=write_header, index=False)
+
+    def _write_parquet(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.target, table.schema)
+        else:
+            table = pa.Table.from_pandas(frame, schema=self._writer.schema, preserve_index=False)
+        #each chunk becomes its own row group
+        self._writer.write_table(table, row_group_size=EXPORT_CHUNK_ROWS)
+
+    def _write_excel(self, frame):
+        from openpyxl import Workbook
+
+        if self._writer is None:
+            #write-only workbooks stream rows to disk rather than keeping every cell in memory
+            self._writer = Workbook(write_only=True)
+
+        for row in frame.itertuples(index=False, name=None):
+            if self._sheet is None or self._sheet_rows >= EXCEL_MAX_ROWS:
+                #start a new sheet when excel's row limit is reached
+                self._add_excel_sheet()
+            self._sheet.append([None if pd.isna(value) else value for value in row])
+            self._sheet_rows += 1
+        if self._sheet is None:
+            self._add_excel_sheet()
+
+    def _add_excel_sheet(self):
+        self._num_sheets += 1
+        title = self.sheet_name if self._num_sheets == 1 else f'{self.sheet_name}_{self._num_sheets}'
+        self._sheet = self._writer.create_sheet(title=title)
+        self._sheet.append(self._output_columns)
+        self._sheet_rows = 1
+
+    def close(self):
+        # Finish the file. If nothing was written, the file holds just the header
+        if self._writer is None:
+            self.write(pd.DataFrame(columns=self.columns or []))
+
+        if self.export_format == 'CSV':
+            self._writer.flush()
+            if isinstance(self.target, str):
+                self._writer.close()
+            else:
+                #leave the caller's buffer open
+                self._writer.detach()
+        elif self.export_format == 'Parquet':
+            self._writer.close()
+        else:
+            self._writer.save(self.target)
+        self._writer = None
+
+#---------------------------------------
+
+def create_export_file(export_format):
+    # Path of a new temporary file to stream an export into, so it is built on disk
+    # rather than in a growing in-memory buffer. Delete it once read
+    file_descriptor, path = tempfile.mkstemp(prefix='forecast_export_', suffix='.' + EXPORT_FORMATS[export_format]['extension'])
+    os.close(file_descriptor)
+    return path
+
+def iter_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Split an in-memory frame into chunks for an ExportWriter
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def export_frame(df, target, export_format, columns=None, sheet_name='forecast'):
+    # Write a whole frame (e.g. a stored forecast or the threshold summary) in chunks
+    with ExportWriter(target, export_format, columns=columns, sheet_name=sheet_name) as writer:
+        for chunk in iter_chunks(df):
+            writer.write(chunk)
+
+def export_stored_forecast(forecast_path, export_format, columns=None, after_date=None, series_name=None):
+    """
+    Export the forecast of a stored run, streaming its parquet file a row
+    group at a time through an ExportWriter into a temporary file.
+
+    Parameters:
+    forecast_path : str
+        Parquet file of the stored forecast.
+    export_format : str
+        One of 'CSV', 'Parquet' or 'Excel'.
+    columns : list, optional
+        Columns to export, all columns if None.
+    after_date : pandas.Timestamp, optional
+        Only periods after this date are exported, e.g. the last date of the
+        history so the fitted history is left out.
+    series_name : str, optional
+        Added as a 'series_name' column.
+
+    Returns:
+    export_bytes : bytes
+        The finished file, for a download button.
+    """
+    import pyarrow.parquet as pq
+
+    export_path = create_export_file(export_format)
+    try:
+        with ExportWriter(export_path, export_format, columns=columns) as writer:
+            for batch in pq.ParquetFile(forecast_path).iter_batches(batch_size=EXPORT_CHUNK_ROWS):
+                chunk = batch.to_pandas()
+                if after_date is not None:
+                    chunk = chunk[chunk['ds'] > after_date]
+                if series_name is not None:
+                    chunk = chunk.assign(series_name=series_name)
+                if len(chunk) > 0:
+                    writer.write(chunk)
+        with open(export_path, 'rb') as export_file:
+            return export_file.read()
+    finally:
+        os.remove(export_path)
+
+@st.cache_data(max_entries=EXPORT_CACHE_ENTRIES, show_spinner='Preparing the download...')
+def export_stored_forecast_cached(forecast_path, export_format, columns=None, after_date=None, series_name=None):
+    # Cached as a stored run never changes, so it is exported once per format and
+    # column choice rather than on every rerun of the app
+    return export_stored_forecast(forecast_path, export_format, columns, after_date, series_name)
+
+#---------------------------------------
+
+def create_threshold_summary(dict_params, dict_thresholds):
+    # One row summary of the demand thresholds, for export alongside the forecast
+    return pd.DataFrame([{
+        'series_name': dict_params.get('series_name'),
+        'demand_percentile': dict_params['demand_percentile'],
+        'confidence_limit': dict_params['confidence_limit'],
+        'forecast_horizon': dict_params['forecast_horizon'],
+        'demand_threshold': float(dict_thresholds['demand_threshold']),
+        'demand_threshold_lower': float(dict_thresholds['demand_threshold_lower']),
+        'demand_threshold_upper': float(dict_thresholds['demand_threshold_upper']),
+    }])
@@ -0,0 +1,234 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from functions import validate_data
+
+
+#length of time each row of a series covers, by unit of measurement. Holiday
+#features count the holiday days falling within this window from each timestamp
+UNIT_TO_PERIOD = {
+    'year': pd.DateOffset(years=1),
+    'quarter': pd.DateOffset(months=3),
+    'month': pd.DateOffset(months=1),
+    'week': pd.Timedelta(days=7),
+    'day': pd.Timedelta(days=1),
+    'hour': pd.Timedelta(days=1),
+    'minute': pd.Timedelta(days=1),
+    'second': pd.Timedelta(days=1),
+}
+
+#column names a regressor cannot take: Prophet's own (it raises on these when the
+#regressor is added) and the columns this app adds to the forecast
+_PROPHET_COMPONENTS = [
+    'trend', 'additive_terms', 'daily', 'weekly', 'yearly', 'holidays', 'zeros',
+    'extra_regressors_additive', 'yhat', 'extra_regressors_multiplicative', 'multiplicative_terms',
+]
+RESERVED_COLUMN_NAMES = set(
+    _PROPHET_COMPONENTS
+    + [name + '_lower' for name in _PROPHET_COMPONENTS]
+    + [name + '_upper' for name in _PROPHET_COMPONENTS]
+    + ['ds', 'y', 'cap', 'floor', 'y_scaled', 'cap_scaled']
+    + ['final_adjusted_demand', 'final_adjusted_demand_lower', 'final_adjusted_demand_upper', 'series_name']
+)
+
+#number of computed feature sets kept in memory
+FEATURE_CACHE_SIZE = 32
+_feature_cache = OrderedDict()
+
+#---------------------------------------
+
+def hash_frame(df):
+    # Fingerprint of a whole DataFrame, used to key the feature cache
+    hashed_rows = pd.util.hash_pandas_object(df, index=False)
+    return hashlib.sha256(hashed_rows.values.tobytes() + str(list(df.columns)).encode('utf-8')).hexdigest()
+
+def _parse_dates(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    datetime_format = validate_data.infer_datetime_format(values)
+    if datetime_format is None:
+        raise ValueError(f"Could not recognise the date format of '{values.name}'.")
+    return pd.to_datetime(values, format=datetime_format, errors='coerce')
+
+def holiday_column_name(name):
+    # Feature column of a holiday: letters and digits kept, anything else as '_'
+    return 'holiday_' + ''.join(character if character.isalnum() else '_' for character in str(name)).lower()
+
+#---------------------------------------
+
+def prepare_holiday_matrix(holidays, start, end):
+    """
+    Expand a holiday calendar into cumulative daily holiday counts.
+
+    Parameters:
+    holidays : pandas.DataFrame
+        Calendar with 'holiday' and 'ds' columns, and optionally
+        'lower_window' / 'upper_window' (days before / after each date that
+        also count, as per Prophet's holidays format). School terms can be
+        given as a single row per term, with upper_window covering the term.
+    start, end : pandas.Timestamp
+        Date range the features are needed for.
+
+    Returns:
+    dict_holiday_matrix : dict
+        'grid_start' (first day of the grid), 'cumulative' (array of shape
+        (num_days + 1, num_holidays) of running holiday day counts) and
+        'columns' (feature column names).
+    """
+    if not {'holiday', 'ds'}.issubset(holidays.columns):
+        raise ValueError("The holiday calendar must contain 'holiday' and 'ds' columns.")
+
+    holidays = holidays.dropna(subset=['holiday', 'ds'])
+    holiday_dates = _parse_dates(holidays['ds']).dt.normalize().values
+    lower_window = holidays['lower_window'].fillna(0).astype(int).values if 'lower_window' in holidays.columns else np.zeros(len(holidays), dtype=int)
+    upper_window = holidays['upper_window'].fillna(0).astype(int).values if 'upper_window' in holidays.columns else np.zeros(len(holidays), dtype=int)
+
+    holiday_codes, holiday_names = pd.factorize(holidays['holiday'].astype(str), sort=True)
+
+    #expand every holiday window into one row per day, without a python loop
+    window_lengths = np.maximum(upper_window - lower_window + 1, 0)
+    row_positions = np.repeat(np.arange(len(holidays)), window_lengths)
+    offsets_within_window = np.arange(window_lengths.sum()) - np.repeat(np.cumsum(window_lengths) - window_lengths, window_lengths)
+    day_offsets = lower_window[row_positions] + offsets_within_window
+    event_days = holiday_dates[row_positions] + day_offsets.astype('timedelta64[D]')
+
+    grid_start = pd.Timestamp(start).normalize()
+    num_days = (pd.Timestamp(end).normalize() - grid_start).days + 1
+    day_positions = ((event_days - grid_start.to_datetime64()) // np.timedelta64(1, 'D')).astype(int)
+    in_range = (day_positions >= 0) & (day_positions < num_days)
+
+    indicators = np.zeros((num_days, len(holiday_names)), dtype=np.int32)
+    indicators[day_positions[in_range], holiday_codes[row_positions][in_range]] = 1
+
+    cumulative = np.zeros((num_days + 1, len(holiday_names)), dtype=np.int32)
+    np.cumsum(indicators, axis=0, out=cumulative[1:])
+
+    columns = [holiday_column_name(name) for name in holiday_names]
+    return {'grid_start': grid_start, 'cumulative': cumulative, 'columns': columns}
+
+def validate_holidays(holidays):
+    # Check a holiday calendar can be used, raising a ValueError naming the problem,
+    # so a bad file is reported when it is loaded rather than when the model is fitted
+    if not {'holiday', 'ds'}.issubset(holidays.columns):
+        raise ValueError("The holiday calendar must contain 'holiday' and 'ds' columns.")
+    if holidays['ds'].notnull().sum() == 0:
+        raise ValueError("The holiday calendar has no dates in its 'ds' column.")
+    _parse_dates(holidays['ds'].dropna())
+    for column in ['lower_window', 'upper_window']:
+        if column in holidays.columns and pd.to_numeric(holidays[column].dropna(), errors='coerce').isna().any():
+            raise ValueError(f"'{column}' must be a whole number of days.")
+    #names differing only in case or punctuation would give the same feature column
+    holiday_names = pd.Series(holidays['holiday'].dropna().astype(str).unique())
+    column_names = holiday_names.map(holiday_column_name)
+    colliding = column_names.duplicated(keep=False)
+    if colliding.any():
+        groups = holiday_names[colliding].groupby(column_names[colliding]).apply(lambda names: ' / '.join(f"'{name}'" for name in names))
+        raise ValueError(f"These holiday names are too alike to tell apart, please rename them: {'; '.join(groups)}.")
+
+#---------------------------------------
+
+def prepare_regressors(regressors):
+    # Sort and index the external regressors by date, ready for an as-of join.
+    # Raises a ValueError if there is no usable regressor column
+    if 'ds' not in regressors.columns:
+        raise ValueError("The regressor file must contain a 'ds' date column.")
+
+    regressors = regressors.copy()
+    regressors['ds'] = _parse_dates(regressors['ds'])
+    value_columns = [column for column in regressors.columns if column not in ['ds', 'y']]
+    if len(value_columns) == 0:
+        raise ValueError("The regressor file must contain at least one regressor column besides 'ds'.")
+    reserved_columns = [str(column) for column in value_columns if column in RESERVED_COLUMN_NAMES or '_delim_' in str(column)]
+    if reserved_columns:
+        raise ValueError(f"Regressor column(s) {', '.join(repr(column) for column in reserved_columns)} use a name the model reserves, please rename them.")
+    for column in value_columns:
+        regressors[column] = pd.to_numeric(regressors[column], errors='coerce')
+        if regressors[column].isna().all():
+            raise ValueError(f"Regressor column '{column}' has no numeric values.")
+    regressors = regressors.dropna(subset=['ds']).sort_values('ds', kind='stable')
+    regressors = regressors.drop_duplicates(subset='ds', keep='last').reset_index(drop=True)
+    #gaps take the latest value known, leading gaps the first, so no NaN reaches the model
+    regressors[value_columns] = regressors[value_columns].ffill().bfill()
+    return regressors[['ds'] + value_columns]
+
+#---------------------------------------
+
+def build_feature_set(holidays, regressors, start, end, unit_of_measurement):
+    """
+    Build (or fetch from the cache) the holiday and regressor features for a
+    date range. The result is reused for every frame joined onto it - the
+    history, each chunk of the future, and other series over the same range.
+
+    Parameters:
+    holidays : pandas.DataFrame or None
+        Holiday calendar, see prepare_holiday_matrix.
+    regressors : pandas.DataFrame or None
+        External regressors, with a 'ds' column and one column per regressor.
+    start, end : pandas.Timestamp
+        Date range the features are needed for.
+    unit_of_measurement : str
+        Unit of the series (e.g. 'day', 'week'), setting the window holiday
+        days are counted over.
+
+    Returns:
+    feature_set : dict
+        Prepared features and the list of feature 'columns'.
+    """
+    cache_key = (
+        hash_frame(holidays) if holidays is not None else None,
+        hash_frame(regressors) if regressors is not None else None,
+        pd.Timestamp(start),
+        pd.Timestamp(end),
+        unit_of_measurement
+    )
+    if cache_key in _feature_cache:
+        _feature_cache.move_to_end(cache_key)
+        return _feature_cache[cache_key]
+
+    feature_set = {'unit_of_measurement': unit_of_measurement, 'holidays': None, 'regressors': None, 'columns': []}
+    if holidays is not None:
+        #pad by one period so the window of the last timestamp is covered
+        feature_set['holidays'] = prepare_holiday_matrix(holidays, start, pd.Timestamp(end) + UNIT_TO_PERIOD[unit_of_measurement])
+        feature_set['columns'] += feature_set['holidays']['columns']
+    if regressors is not None:
+        feature_set['regressors'] = prepare_regressors(regressors)
+        feature_set['columns'] += [column for column in feature_set['regressors'].columns if column != 'ds']
+
+    _feature_cache[cache_key] = feature_set
+    while len(_feature_cache) > FEATURE_CACHE_SIZE:
+        _feature_cache.popitem(last=False)
+    return feature_set
+
+#---------------------------------------
+
+def add_features(frame, feature_set):
+    # Join the prepared features onto a frame with a sorted 'ds' column
+    frame = frame.drop(columns=[column for column in feature_set['columns'] if column in frame.columns])
+    if not frame['ds'].is_monotonic_increasing:
+        frame = frame.sort_values('ds', kind='stable')
+    frame = frame.reset_index(drop=True)
+
+    dict_holidays = feature_set['holidays']
+    if dict_holidays is not None:
+        #count the holiday days in the window starting at each timestamp, by
+        #differencing the cumulative counts at either end of the window
+        window_start = pd.DatetimeIndex(frame['ds']).normalize()
+        window_end = window_start + UNIT_TO_PERIOD[feature_set['unit_of_measurement']]
+        num_days = dict_holidays['cumulative'].shape[0] - 1
+        start_positions = np.clip((window_start - dict_holidays['grid_start']).days, 0, num_days)
+        end_positions = np.clip((window_end - dict_holidays['grid_start']).days, 0, num_days)
+        holiday_counts = dict_holidays['cumulative'][end_positions] - dict_holidays['cumulative'][start_positions]
+        frame = pd.concat([frame, pd.DataFrame(holiday_counts, columns=dict_holidays['columns'])], axis=1)
+
+    regressors = feature_set['regressors']
+    if regressors is not None:
+        #as-of join: each timestamp takes the latest regressor value known at that time.
+        #timestamps before the first regressor value take the first value
+        frame = pd.merge_asof(frame, regressors, on='ds', direction='backward')
+        value_columns = [column for column in regressors.columns if column != 'ds']
+        frame[value_columns] = frame[value_columns].fillna(regressors[value_columns].iloc[0])
+
+    return frame
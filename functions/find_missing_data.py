@@ -1,7 +1,7 @@
-import pandas as pd
-
-# Example of identifying missing dates in a daily time series
-def find_missing_dates(df, date_column='ds', frequency='D'):
-    full_range = pd.date_range(start=df[date_column].min(), end=df[date_column].max(), freq=frequency)
-    missing_dates = full_range.difference(df[date_column])
+import pandas as pd
+
+# Example of identifying missing dates in a daily time series
+def find_missing_dates(df, date_column='ds', frequency='D'):
+    full_range = pd.date_range(start=df[date_column].min(), end=df[date_column].max(), freq=frequency)
+    missing_dates = full_range.difference(df[date_column])
     return missing_dates
\ No newline at end of file
@@ -0,0 +1,199 @@
+import re
+import time
+
+import numpy as np
+
+
+#'Auto' leaves the choice to Prophet: Newton for under 100 rows, LBFGS otherwise
+OPTIMIZER_ALGORITHMS = ['Auto', 'LBFGS', 'BFGS', 'Newton']
+
+INIT_METHODS = ['Prophet default', 'Linear trend', 'Previous fit']
+
+#cmdstan's defaults for the optimizer
+DEFAULT_ITER = 10000
+DEFAULT_TOL_REL_GRAD = 1e7
+
+#rows in a line of cmdstan's (L)BFGS iteration table: iteration, log prob, ||dx||, ||grad||, alpha, alpha0, evals
+_BFGS_ITERATION_ROW = re.compile(r'^\s*(\d+)\s+(-?[\d.e+-]+)\s+[\d.e+-]+\s+[\d.e+-]+\s+[\d.e+-]+\s+[\d.e+-]+\s+(\d+)')
+_NEWTON_ITERATION_ROW = re.compile(r'^Iteration\s+(\d+)\. Log joint probability =\s*(-?\d+(?:\.\d+)?(?:e[+-]?\d+)?)')
+
+#---------------------------------------
+
+def resolve_algorithm(dict_params, num_rows):
+    # The algorithm the fit will start with, as Prophet would choose it for 'Auto'
+    algorithm = dict_params['optimizer_algorithm']
+    if algorithm == 'Auto':
+        return 'Newton' if num_rows < 100 else 'LBFGS'
+    return algorithm
+
+def linear_trend_init(model, df):
+    # Least squares line through the whole history, in Prophet's scaled units (time
+    # scaled to 0-1, y divided by its absolute max or range). Prophet's own start
+    # only passes through the first and last points, so is thrown by an odd end point
+    history = df[df['y'].notnull()]
+    ds = history['ds'].values.astype('datetime64[ns]').astype(np.int64)
+    y = history['y'].values.astype(float)
+    time_scaled = (ds - ds.min()) / max(ds.max() - ds.min(), 1)
+    if model.scaling == 'minmax':
+        y_min, y_scale = y.min(), y.max() - y.min()
+    else:
+        y_min, y_scale = 0.0, np.abs(y).max()
+    y_scaled = (y - y_min) / (y_scale if y_scale != 0 else 1.0)
+    k, m = np.polyfit(time_scaled, y_scaled, 1)
+    #empty changepoint / seasonality arrays are replaced by Prophet's zeros
+    return {'k': k, 'm': m, 'sigma_obs': 1.0, 'delta': np.array([]), 'beta': np.array([])}
+
+def extract_warm_start(model):
+    # Fitted parameters of a model, to start the next fit of the same series from.
+    # Changepoint and seasonality parameters are only reused if their shapes still match.
+    # None if Stan never ran: Prophet sets the parameters of a constant history itself,
+    # with no noise, which is no place to start a real fit from
+    if model.stan_fit is None:
+        return None
+    return {
+        'k': float(np.ravel(model.params['k'])[0]),
+        'm': float(np.ravel(model.params['m'])[0]),
+        'sigma_obs': float(np.ravel(model.params['sigma_obs'])[0]),
+        'delta': np.ravel(model.params['delta']),
+        'beta': np.ravel(model.params['beta']),
+    }
+
+#---------------------------------------
+
+def build_fit_kwargs(model, df, dict_params, previous_params=None):
+    """
+    Keyword arguments for Prophet's fit, passed on to cmdstan's optimizer.
+
+    Parameters:
+    model : Prophet
+        The model about to be fitted.
+    df : pandas.DataFrame
+        History the model will be fitted on.
+    dict_params : dict
+        Model parameters, including 'optimizer_algorithm', 'optimizer_iter',
+        'optimizer_tol_rel_grad' and 'fit_init'.
+    previous_params : dict, optional
+        From extract_warm_start, used when fit_init is 'Previous fit'.
+
+    Returns:
+    dict_kwargs : dict
+    """
+    dict_kwargs = {'iter': int(dict_params['optimizer_iter'])}
+    if dict_params['optimizer_algorithm'] != 'Auto':
+        dict_kwargs['algorithm'] = dict_params['optimizer_algorithm']
+    #Newton has no tolerance settings
+    if resolve_algorithm(dict_params, len(df)) != 'Newton':
+        dict_kwargs['tol_rel_grad'] = float(dict_params['optimizer_tol_rel_grad'])
+
+    if dict_params['fit_init'] == 'Linear trend':
+        dict_kwargs['init'] = linear_trend_init(model, df)
+    elif dict_params['fit_init'] == 'Previous fit' and previous_params is not None:
+        dict_kwargs['init'] = previous_params
+    return dict_kwargs
+
+def parse_optimizer_output(stdout_path):
+    # Iterations, gradient evaluations, final log probability and cmdstan's closing
+    # message from the console output of an optimize run
+    with open(stdout_path) as file:
+        lines = file.read().splitlines()
+
+    iterations, evaluations, log_prob = 0, None, None
+    for line in lines:
+        match = _BFGS_ITERATION_ROW.match(line)
+        if match is not None:
+            iterations, log_prob, evaluations = int(match.group(1)), float(match.group(2)), int(match.group(3))
+            continue
+        match = _NEWTON_ITERATION_ROW.match(line)
+        if match is not None:
+            iterations, log_prob = int(match.group(1)), float(match.group(2))
+
+    message = None
+    for position, line in enumerate(lines):
+        if line.startswith('Optimization terminated'):
+            message = ' '.join(part.strip() for part in lines[position:position + 2] if part.strip())
+    return {'iterations': iterations, 'evaluations': evaluations, 'log_prob': log_prob, 'message': message}
+
+#---------------------------------------
+
+def fit_model(model, df, dict_params, previous_params=None):
+    """
+    Fit a Prophet model with the chosen optimizer settings, and record how
+    the fit went.
+
+    Parameters:
+    model : Prophet
+        Unfitted model, with any regressors already added.
+    df : pandas.DataFrame
+        History to fit on.
+    dict_params : dict
+        Model parameters, see build_fit_kwargs.
+    previous_params : dict, optional
+        From extract_warm_start, used when fit_init is 'Previous fit'.
+
+    Returns:
+    dict_diagnostics : dict
+        'algorithm' requested and 'algorithm_used' (Prophet falls back to
+        Newton if (L)BFGS fails), 'init', 'iterations', 'evaluations',
+        'log_prob', 'converged', cmdstan's 'message', and the fit time split
+        into 'cmdstan_seconds' (the optimizer process) and 'python_seconds'
+        (preparing the data and reading the results).
+    """
+    dict_kwargs = build_fit_kwargs(model, df, dict_params, previous_params)
+    cmdstan_model = model.stan_backend.model
+    list_attempts = []
+
+    #time each optimizer attempt, and the cmdstan process within it, on this model's
+    #backend only. Tolerances are dropped if Prophet falls back on Newton
+    original_optimize = cmdstan_model.optimize
+    original_run_cmdstan = getattr(cmdstan_model, '_run_cmdstan', None)
+
+    def timed_optimize(**kwargs):
+        if kwargs.get('algorithm') == 'Newton':
+            kwargs = {key: value for key, value in kwargs.items() if not key.startswith('tol_')}
+        list_attempts.append({'algorithm': kwargs.get('algorithm'), 'cmdstan_seconds': 0.0})
+        return original_optimize(**kwargs)
+
+    def timed_run_cmdstan(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_run_cmdstan(*args, **kwargs)
+        finally:
+            list_attempts[-1]['cmdstan_seconds'] += time.perf_counter() - start
+
+    cmdstan_model.optimize = timed_optimize
+    if original_run_cmdstan is not None:
+        cmdstan_model._run_cmdstan = timed_run_cmdstan
+    start = time.perf_counter()
+    try:
+        model.fit(df, **dict_kwargs)
+    finally:
+        total_seconds = time.perf_counter() - start
+        del cmdstan_model.optimize
+        if original_run_cmdstan is not None:
+            del cmdstan_model._run_cmdstan
+
+    dict_diagnostics = {
+        'algorithm': dict_params['optimizer_algorithm'],
+        'algorithm_used': list_attempts[-1]['algorithm'] if len(list_attempts) > 0 else None,
+        'attempts': len(list_attempts),
+        'init': dict_params['fit_init'] if 'init' in dict_kwargs else 'Prophet default',
+        'iterations': 0,
+        'evaluations': None,
+        'log_prob': None,
+        'converged': True,
+        'message': 'Constant series, no optimization needed',
+        'total_seconds': total_seconds,
+        'cmdstan_seconds': sum((attempt['cmdstan_seconds'] for attempt in list_attempts), 0.0),
+    }
+    dict_diagnostics['python_seconds'] = total_seconds - dict_diagnostics['cmdstan_seconds']
+
+    if len(list_attempts) > 0 and model.stan_fit is not None:
+        dict_diagnostics.update(parse_optimizer_output(model.stan_fit.runset.stdout_files[0]))
+        if dict_diagnostics['algorithm_used'] == 'Newton':
+            #Newton stops without a message once it stops improving
+            dict_diagnostics['converged'] = dict_diagnostics['iterations'] < int(dict_params['optimizer_iter'])
+            if dict_diagnostics['message'] is None:
+                dict_diagnostics['message'] = 'Converged' if dict_diagnostics['converged'] else 'Maximum number of iterations hit'
+        else:
+            dict_diagnostics['converged'] = dict_diagnostics['message'] is not None and 'Convergence detected' in dict_diagnostics['message']
+    return dict_diagnostics
@@ -1,36 +1,322 @@
-
-import pandas as pd
-import numpy as np
-import streamlit as st
-
-
-#---------------------------------------
-
-def adjust_forecast_for_appointments(df, forecast, appointments_per_unit, dna_rate, dna_discharge_policy, max_num_dnas, unit_of_measurement):
-    # Adjust demand by the number of appointments per unit
-    forecast['adjusted_demand'] = forecast['yhat'] * appointments_per_unit
-    # Adjust the upper and lower bounds of the confidence interval
-    forecast['adjusted_demand_upper'] = forecast['yhat_upper'] * appointments_per_unit
-    forecast['adjusted_demand_lower'] = forecast['yhat_lower'] * appointments_per_unit
-
-    # Apply DNA rate adjustment
-    forecast['adjusted_demand'] *= (1 - dna_rate)
-    forecast['adjusted_demand_upper'] *= (1 - dna_rate)
-    forecast['adjusted_demand_lower'] *= (1 - dna_rate)
-    
-    # Implement DNA discharge policy adjustment if applicable
-    if dna_discharge_policy == 'Yes' and isinstance(max_num_dnas, int):
-        # Calculate the discharge rate based on the policy
-        discharge_rate = (1 - dna_rate) ** max_num_dnas
-        forecast['final_adjusted_demand'] = forecast['adjusted_demand'] * discharge_rate
-        forecast['final_adjusted_demand_upper'] = forecast['adjusted_demand_upper'] * discharge_rate
-        forecast['final_adjusted_demand_lower'] = forecast['adjusted_demand_lower'] * discharge_rate
-    else:
-        # If no discharge policy, keep the adjusted demand as is
-        forecast['final_adjusted_demand'] = forecast['adjusted_demand']
-        forecast['final_adjusted_demand_upper'] = forecast['adjusted_demand_upper']
-        forecast['final_adjusted_demand_lower'] = forecast['adjusted_demand_lower']
-
-    return forecast
-
-
+
+import pandas as pd
+import numpy as np
+import streamlit as st
+from prophet import Prophet
+
+from functions import detect_outliers as outliers
+from functions import features
+from functions import fit_controls
+
+
+#defaults mirror the sidebar defaults in the app. Used where the pipeline runs
+#without the sidebar (the forecast service, hierarchical forecasts)
+DEFAULT_PARAMS = {
+    'datetime_field': 'ds',
+    'activity_count_field': 'y',
+    'unit_of_measurement': 'day',
+    'dict_unit_text_to_parameter_term': 'D',
+    'num_appts_per_patient': 'Single appt per patient',
+    'average_appointments_per_pt': 1,
+    'dna_rate': 5,
+    'dna_policy_used': 'No',
+    'max_num_dnas': 'NA',
+    'outlier_detection_method': 'iqr',
+    'outlier_detection_method_threshold': 1.5,
+    'outlier_handling_method_argument': 'linear',
+    'polynomial_degree_value': 'NA',
+    'demand_percentile': 0.85,
+    'forecast_horizon': 30,
+    'confidence_limit': 0.95,
+    'predict_chunk_size': 1000,
+    'holidays_df': None,
+    'regressors_df': None,
+    'history_window_mode': 'Full history',
+    'history_window_backtest': False,
+    'optimizer_algorithm': 'Auto',
+    'optimizer_iter': fit_controls.DEFAULT_ITER,
+    'optimizer_tol_rel_grad': fit_controls.DEFAULT_TOL_REL_GRAD,
+    'fit_init': 'Prophet default',
+}
+
+#params that change the fitted model. Any other param only changes prediction / thresholds
+FIT_PARAM_KEYS = [
+    'datetime_field',
+    'activity_count_field',
+    'unit_of_measurement',
+    'dict_unit_text_to_parameter_term',
+    'outlier_detection_method',
+    'outlier_detection_method_threshold',
+    'outlier_handling_method_argument',
+    'polynomial_degree_value',
+    'confidence_limit',
+    'holidays_df',
+    'regressors_df',
+    'optimizer_algorithm',
+    'optimizer_iter',
+    'optimizer_tol_rel_grad',
+    'fit_init',
+]
+
+#params that change the forecast or its thresholds. Display and export settings are left out,
+#so changing them does not count as a different run
+FORECAST_PARAM_KEYS = FIT_PARAM_KEYS + [
+    'history_window_mode',
+    'num_appts_per_patient',
+    'average_appointments_per_pt',
+    'dna_rate',
+    'dna_policy_used',
+    'max_num_dnas',
+    'demand_percentile',
+    'forecast_horizon',
+]
+
+
+#---------------------------------------
+
+def adjust_forecast_for_appointments(df, forecast, appointments_per_unit, dna_rate, dna_discharge_policy, max_num_dnas, unit_of_measurement):
+    # Adjust demand by the number of appointments per unit
+    forecast['adjusted_demand'] = forecast['yhat'] * appointments_per_unit
+    # Adjust the upper and lower bounds of the confidence interval
+    forecast['adjusted_demand_upper'] = forecast['yhat_upper'] * appointments_per_unit
+    forecast['adjusted_demand_lower'] = forecast['yhat_lower'] * appointments_per_unit
+
+    # Apply DNA rate adjustment
+    forecast['adjusted_demand'] *= (1 - dna_rate)
+    forecast['adjusted_demand_upper'] *= (1 - dna_rate)
+    forecast['adjusted_demand_lower'] *= (1 - dna_rate)
+    
+    # Implement DNA discharge policy adjustment if applicable
+    if dna_discharge_policy == 'Yes' and isinstance(max_num_dnas, int):
+        # Calculate the discharge rate based on the policy
+        discharge_rate = (1 - dna_rate) ** max_num_dnas
+        forecast['final_adjusted_demand'] = forecast['adjusted_demand'] * discharge_rate
+        forecast['final_adjusted_demand_upper'] = forecast['adjusted_demand_upper'] * discharge_rate
+        forecast['final_adjusted_demand_lower'] = forecast['adjusted_demand_lower'] * discharge_rate
+    else:
+        # If no discharge policy, keep the adjusted demand as is
+        forecast['final_adjusted_demand'] = forecast['adjusted_demand']
+        forecast['final_adjusted_demand_upper'] = forecast['adjusted_demand_upper']
+        forecast['final_adjusted_demand_lower'] = forecast['adjusted_demand_lower']
+
+    return forecast
+
+
+#---------------------------------------
+
+def anchor_freq(freq, last_date):
+    # Offset for the unit's pandas frequency, anchored so the future carries on
+    # from the last date (e.g. weekly data on Sundays stays on Sundays, monthly
+    # data on the 15th stays on the 15th) rather than snapping to the default anchor
+    last_date = pd.Timestamp(last_date)
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if isinstance(offset, pd.offsets.Week) and offset.weekday is not None:
+        return pd.offsets.Week(weekday=last_date.weekday())
+    if isinstance(offset, (pd.offsets.MonthEnd, pd.offsets.QuarterEnd, pd.offsets.YearEnd)) and not last_date.is_month_end:
+        #step whole months from the last date, keeping its day of the month
+        if isinstance(offset, pd.offsets.MonthEnd):
+            return pd.DateOffset(months=1)
+        if isinstance(offset, pd.offsets.QuarterEnd):
+            return pd.DateOffset(months=3)
+        return pd.DateOffset(months=12)
+    return offset
+
+def make_future_dates_in_chunks(last_date, forecast_horizon, chunk_size, freq):
+    # Yield the future dates in fixed size chunks, one per unit of measurement
+    # after last_date, without ever building the whole horizon at once.
+    # freq is the unit's pandas frequency, e.g. dict_unit_text_to_parameter_term
+    last_date = pd.Timestamp(last_date)
+    cursor = last_date
+    offset = anchor_freq(freq, cursor)
+    remaining = int(forecast_horizon)
+    num_done = 0
+    while remaining > 0:
+        num_periods = min(chunk_size, remaining)
+        if type(offset) is pd.DateOffset:
+            #whole months are counted from the last date, so a day past the end of a
+            #short month (e.g. the 30th in February) does not carry into later months
+            dates = pd.DatetimeIndex([last_date + offset * i for i in range(num_done + 1, num_done + num_periods + 1)])
+        else:
+            dates = pd.date_range(start=cursor, periods=num_periods + 1, freq=offset)
+            dates = dates[dates > cursor][:num_periods]
+        if len(dates) == 0:
+            break
+        yield pd.DataFrame({'ds': dates})
+        cursor = dates[-1]
+        remaining -= len(dates)
+        num_done += len(dates)
+
+#---------------------------------------
+
+def predict_in_chunks(model, df, dict_params, chunk_size=1000, max_display_rows=5000, feature_set=None, on_chunk=None):
+    """
+    Predict the forecast horizon in fixed size chunks.
+
+    Each chunk is passed through Prophet, adjusted for appointments / DNAs
+    where required, and reduced to the values needed for the demand
+    thresholds. Only a downsampled view of the future is kept for display,
+    so the memory used by Prophet's uncertainty sampling is bounded by the
+    chunk size rather than the horizon.
+
+    Parameters:
+    model : prophet.Prophet
+        Fitted Prophet model.
+    df : pandas.DataFrame
+        The cleaned data the model was fitted on.
+    dict_params : dict
+        Parameters returned by the sidebar. The future has one row per unit
+        of measurement, at the 'dict_unit_text_to_parameter_term' frequency.
+    chunk_size : int
+        Number of future periods to predict at a time.
+    max_display_rows : int
+        Maximum number of future rows kept for plots and display.
+    feature_set : dict, optional
+        Holiday / regressor features the model was fitted with, joined onto
+        each chunk before it is predicted.
+    on_chunk : callable, optional
+        Called with every full (not downsampled) future chunk, e.g. an
+        export writer's write method.
+
+    Returns:
+    forecast : pandas.DataFrame
+        Fitted values over the history plus the downsampled future.
+    dict_threshold_values : dict
+        Arrays of the future 'yhat', 'yhat_upper' and 'yhat_lower' values
+        (adjusted for appointments if a multiple appt service) used to
+        derive the demand thresholds, and their dates 'ds'.
+    """
+    forecast_horizon = int(dict_params['forecast_horizon'])
+    chunk_size = max(int(chunk_size), 1)
+    multiple_appts = dict_params['num_appts_per_patient'] != "Single appt per patient"
+
+    #columns the thresholds are derived from, depending on service type
+    if multiple_appts:
+        threshold_columns = {
+            'yhat': 'final_adjusted_demand',
+            'yhat_upper': 'final_adjusted_demand_upper',
+            'yhat_lower': 'final_adjusted_demand_lower'
+        }
+    else:
+        threshold_columns = {'yhat': 'yhat', 'yhat_upper': 'yhat_upper', 'yhat_lower': 'yhat_lower'}
+
+    def adjust_chunk(forecast_chunk):
+        if not multiple_appts:
+            return forecast_chunk
+        return adjust_forecast_for_appointments(
+            df,
+            forecast_chunk,
+            dict_params['average_appointments_per_pt'],
+            dict_params['dna_rate'] / 100,
+            dict_params['dna_policy_used'],
+            dict_params['max_num_dnas'],
+            dict_params['unit_of_measurement']
+        )
+
+    def add_chunk_features(future_chunk):
+        if feature_set is None:
+            return future_chunk
+        return features.add_features(future_chunk, feature_set)
+
+    #fitted values over the history, needed for the plots
+    history_dates = model.history[['ds']].copy()
+    forecast_history = adjust_chunk(model.predict(add_chunk_features(history_dates)))
+
+    #preallocate the threshold accumulators, one float per future period,
+    #plus the future dates they belong to
+    dict_threshold_values = {key: np.empty(forecast_horizon, dtype=float) for key in threshold_columns}
+    dict_threshold_values['ds'] = np.empty(forecast_horizon, dtype='datetime64[ns]')
+
+    #keep every nth future row for display
+    display_step = max(int(np.ceil(forecast_horizon / max(int(max_display_rows), 1))), 1)
+    list_display_chunks = []
+
+    position = 0
+    freq = dict_params['dict_unit_text_to_parameter_term']
+    for future_chunk in make_future_dates_in_chunks(history_dates['ds'].max(), forecast_horizon, chunk_size, freq):
+        forecast_chunk = adjust_chunk(model.predict(add_chunk_features(future_chunk)))
+
+        num_rows = len(forecast_chunk)
+        for key, column in threshold_columns.items():
+            dict_threshold_values[key][position:position + num_rows] = forecast_chunk[column].values
+        dict_threshold_values['ds'][position:position + num_rows] = forecast_chunk['ds'].values
+
+        if on_chunk is not None:
+            on_chunk(forecast_chunk)
+
+        #offset the step so the downsampling is continuous across chunks
+        first_row = (-position) % display_step
+        list_display_chunks.append(forecast_chunk.iloc[first_row::display_step])
+        position += num_rows
+
+    for key in dict_threshold_values:
+        dict_threshold_values[key] = dict_threshold_values[key][:position]
+
+    forecast = pd.concat([forecast_history] + list_display_chunks, ignore_index=True)
+
+    return forecast, dict_threshold_values
+
+#---------------------------------------
+
+def format_percentile(demand_percentile):
+    # Percentile as ordinal text, e.g. 0.85 -> '85th'. demand_percentile is a fraction
+    percentile_value = round(demand_percentile * 100)
+    if percentile_value % 100 in [11, 12, 13]:
+        ending = 'th'
+    else:
+        ending = {1: 'st', 2: 'nd', 3: 'rd'}.get(percentile_value % 10, 'th')
+    return f'{percentile_value}{ending}'
+
+def calculate_demand_thresholds(dict_threshold_values, demand_percentile):
+    # Demand and confidence interval at the user-provided percentile.
+    # demand_percentile is held as a fraction (e.g. 0.85) so is scaled to the
+    # 0-100 range np.percentile expects
+    return {
+        'demand_threshold': np.percentile(dict_threshold_values['yhat'], demand_percentile * 100),
+        'demand_threshold_upper': np.percentile(dict_threshold_values['yhat_upper'], demand_percentile * 100),
+        'demand_threshold_lower': np.percentile(dict_threshold_values['yhat_lower'], demand_percentile * 100)
+    }
+
+#---------------------------------------
+
+def fit_forecast_model(df, dict_params, previous_params=None):
+    # Headless version of the outlier handling and model fitting steps in main.py.
+    # Returns the fitted model, the cleaned data it was fitted on and the fit diagnostics
+    outlier_results = outliers.detect_outliers(
+        df,
+        method=dict_params['outlier_detection_method'],
+        threshold=dict_params['outlier_detection_method_threshold']
+        )
+
+    df_cleaned = outliers.replace_outliers_and_interpolate(
+        df,
+        outlier_results,
+        dict_params['datetime_field'],
+        dict_params['activity_count_field'],
+        dict_params['outlier_handling_method_argument'],
+        dict_params['dict_unit_text_to_parameter_term'],
+        dict_params['polynomial_degree_value']
+        )
+
+    feature_set = build_feature_set_for_params(df_cleaned, dict_params)
+    model = Prophet(interval_width=dict_params['confidence_limit'])
+    if feature_set is not None:
+        df_cleaned = features.add_features(df_cleaned, feature_set)
+        for column in feature_set['columns']:
+            model.add_regressor(column)
+    dict_fit_diagnostics = fit_controls.fit_model(model, df_cleaned, dict_params, previous_params)
+
+    return model, df_cleaned, dict_fit_diagnostics
+
+#---------------------------------------
+
+def build_feature_set_for_params(df, dict_params):
+    # Holiday / regressor features covering the history and the forecast horizon
+    # (at the unit's frequency), or None if no holiday calendar or regressor file was provided
+    holidays_df = dict_params.get('holidays_df')
+    regressors_df = dict_params.get('regressors_df')
+    if holidays_df is None and regressors_df is None:
+        return None
+
+    last_date = df['ds'].max()
+    end_date = last_date + anchor_freq(dict_params['dict_unit_text_to_parameter_term'], last_date) * int(dict_params['forecast_horizon'])
+    return features.build_feature_set(holidays_df, regressors_df, df['ds'].min(), end_date, dict_params['unit_of_measurement'])
@@ -0,0 +1,382 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from functions import forecast_functions
+
+
+RECONCILIATION_METHODS = ['Bottom-up', 'OLS', 'MinT (diagonal)']
+
+#name of the node summing every bottom level series
+TOTAL_NODE_NAME = 'Total'
+
+#Prophet needs at least two values to fit. Series with fewer have no activity to forecast
+MIN_VALUES_TO_FIT = 2
+
+#---------------------------------------
+
+def build_summing_matrix(df_hierarchy, level_columns):
+    """
+    Build the sparse summing matrix mapping the bottom level series to every
+    node of the hierarchy.
+
+    Parameters:
+    df_hierarchy : pandas.DataFrame
+        One row per bottom level series, with a column per level.
+    level_columns : list
+        Level columns ordered from the top level down. The last column
+        identifies the bottom level series.
+
+    Returns:
+    summing_matrix : scipy.sparse.csr_matrix
+        Matrix of shape (num_nodes, num_bottom_series), with a 1 where a
+        bottom series contributes to a node.
+    df_nodes : pandas.DataFrame
+        'node' name and 'level' of every node, by level. An aggregate covering
+        a single series, or the same series as its parent, duplicates another
+        node, so has no row of its own in the summing matrix. Its 'same_as'
+        holds the node it duplicates; for every other node it is None.
+    bottom_series : numpy.ndarray
+        The bottom level series, in column order of the summing matrix.
+    node_rows : numpy.ndarray
+        Row of the summing matrix giving each node of df_nodes.
+    """
+    df_hierarchy = df_hierarchy.drop_duplicates(subset=level_columns[-1])
+    #order the bottom series by their full path, so the bottom rows of the
+    #summing matrix form an identity block (relied on by reconcile)
+    full_path = df_hierarchy[level_columns].astype(str).agg(' / '.join, axis=1)
+    df_hierarchy = df_hierarchy.iloc[np.argsort(full_path.values, kind='stable')].reset_index(drop=True)
+    bottom_series = df_hierarchy[level_columns[-1]].astype(str).values
+    num_bottom = len(bottom_series)
+
+    list_rows = []
+    list_columns = []
+    list_names = []
+    list_levels = []
+    list_node_names = []
+    list_node_levels = []
+    list_node_rows = []
+    list_node_kept = []
+    node_offset = 0
+
+    #a single top level node (e.g. one trust) already is the total, so no separate
+    #total is added. parent_sizes holds the number of bottom series under each
+    #bottom series' parent node
+    if df_hierarchy[level_columns[0]].nunique() > 1:
+        list_rows.append(np.zeros(num_bottom, dtype=int))
+        list_columns.append(np.arange(num_bottom))
+        list_names.append(np.array([TOTAL_NODE_NAME]))
+        list_levels.append(TOTAL_NODE_NAME)
+        list_node_names.append(np.array([TOTAL_NODE_NAME]))
+        list_node_levels.append(TOTAL_NODE_NAME)
+        list_node_rows.append(np.zeros(1, dtype=int))
+        list_node_kept.append(np.ones(1, dtype=bool))
+        node_offset = 1
+        parent_sizes = np.full(num_bottom, num_bottom)
+    else:
+        parent_sizes = np.full(num_bottom, num_bottom + 1)
+    #summing matrix row of each bottom series' parent node
+    parent_rows = np.zeros(num_bottom, dtype=int)
+
+    #each level's nodes are identified by their full path, so the same name under
+    #different parents (e.g. 'Clinic A' in two specialties) stays separate
+    path = pd.Series([''] * num_bottom)
+    for level_number, level_column in enumerate(level_columns):
+        separator = '' if level_number == 0 else ' / '
+        path = path + separator + df_hierarchy[level_column].astype(str)
+        codes, names = pd.factorize(path, sort=True)
+        sizes = np.bincount(codes)[codes]
+        if level_number < len(level_columns) - 1:
+            #an aggregate covering the same series as its parent, or a single series,
+            #duplicates another node, so would be fitted and weighted twice
+            is_kept = (sizes < parent_sizes) & (sizes > 1)
+        else:
+            is_kept = np.ones(num_bottom, dtype=bool)
+        kept_codes, kept_rows = np.unique(codes[is_kept], return_inverse=True)
+        list_rows.append(node_offset + kept_rows)
+        list_columns.append(np.flatnonzero(is_kept))
+        list_names.append(np.asarray(names)[kept_codes])
+        list_levels += [level_column] * len(kept_codes)
+
+        #a node left out of the matrix takes its parent's row, or for a single series
+        #the bottom level row. Bottom rows are only known once every level is added,
+        #so are held as an offset from the end
+        rows = np.where(sizes == 1, np.arange(num_bottom) - num_bottom, parent_rows)
+        rows[is_kept] = node_offset + kept_rows
+        first_members = np.unique(codes, return_index=True)[1]
+        list_node_names.append(np.asarray(names))
+        list_node_levels += [level_column] * len(names)
+        list_node_rows.append(rows[first_members])
+        list_node_kept.append(is_kept[first_members])
+
+        node_offset += len(kept_codes)
+        parent_sizes = sizes
+        parent_rows = rows
+
+    rows = np.concatenate(list_rows)
+    columns = np.concatenate(list_columns)
+    summing_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(node_offset, num_bottom))
+
+    node_rows = np.concatenate(list_node_rows)
+    node_rows[node_rows < 0] += node_offset
+    matrix_names = np.concatenate(list_names)
+    df_nodes = pd.DataFrame({
+        'node': np.concatenate(list_node_names),
+        'level': list_node_levels,
+        'same_as': np.where(np.concatenate(list_node_kept), None, matrix_names[node_rows]),
+        })
+    return summing_matrix, df_nodes, bottom_series, node_rows
+
+#---------------------------------------
+
+def pivot_bottom_series(df_long, bottom_series, datetime_field, series_field, activity_count_field):
+    # Matrix of history (num_bottom_series, num_dates) in the summing matrix's column order
+    df_wide = df_long.pivot_table(index=series_field, columns=datetime_field, values=activity_count_field, aggfunc='sum')
+    df_wide.index = df_wide.index.astype(str)
+    df_wide = df_wide.reindex(bottom_series)
+    return df_wide.columns, df_wide.values
+
+#---------------------------------------
+
+def forecast_node(dates, values, dict_params):
+    # Forecast a single node with the app's pipeline. Executed in a pool worker.
+    # Returns the future yhat / lower / upper arrays, the in-sample residual variance
+    # and the fit diagnostics
+    df = pd.DataFrame({'ds': dates, 'y': values})
+    model, df_cleaned, dict_fit_diagnostics = forecast_functions.fit_forecast_model(df, dict_params)
+    forecast, dict_threshold_values = forecast_functions.predict_in_chunks(
+        model,
+        df_cleaned,
+        dict_params,
+        chunk_size=dict_params['predict_chunk_size'],
+        max_display_rows=max(int(dict_params['forecast_horizon']), 1),
+        feature_set=forecast_functions.build_feature_set_for_params(model.history, dict_params)
+        )
+
+    fitted = forecast.iloc[:len(model.history)]['yhat'].values
+    residual_variance = np.nanvar(model.history['y'].values - fitted)
+    return dict_threshold_values['yhat'], dict_threshold_values['yhat_lower'], dict_threshold_values['yhat_upper'], residual_variance, dict_fit_diagnostics
+
+def forecast_nodes(dates, history_matrix, dict_params, max_workers=None):
+    """
+    Base forecasts for each row of history_matrix, fitted in parallel. Rows
+    with fewer than two values (series with no activity) are not fitted and
+    are forecast as zero.
+
+    Returns:
+    dict_base : dict
+        'yhat', 'yhat_lower' and 'yhat_upper' arrays of shape
+        (num_rows, forecast_horizon), 'residual_variance' per row and the
+        'fit_diagnostics' of each row's fit.
+    """
+    is_active = np.sum(~np.isnan(history_matrix), axis=1) >= MIN_VALUES_TO_FIT
+    active_rows = np.flatnonzero(is_active)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        active_results = list(executor.map(
+            forecast_node,
+            [dates] * len(active_rows),
+            list(history_matrix[active_rows]),
+            [dict_params] * len(active_rows)
+            ))
+
+    #a zero forecast with no uncertainty for the inactive rows. Their residual variance
+    #is left as NaN, so MinT gives them the largest weight and keeps them at zero
+    forecast_horizon = len(active_results[0][0]) if len(active_results) > 0 else int(dict_params['forecast_horizon'])
+    zeros = np.zeros(forecast_horizon)
+    dict_inactive_diagnostics = {
+        'algorithm': dict_params['optimizer_algorithm'],
+        'algorithm_used': None,
+        'attempts': 0,
+        'init': dict_params['fit_init'],
+        'iterations': 0,
+        'evaluations': None,
+        'log_prob': None,
+        'converged': True,
+        'message': 'No activity, forecast as zero',
+        'total_seconds': 0.0,
+        'cmdstan_seconds': 0.0,
+        'python_seconds': 0.0,
+    }
+    results = [(zeros, zeros, zeros, np.nan, dict_inactive_diagnostics)] * history_matrix.shape[0]
+    for row, result in zip(active_rows, active_results):
+        results[row] = result
+
+    return {
+        'yhat': np.vstack([result[0] for result in results]),
+        'yhat_lower': np.vstack([result[1] for result in results]),
+        'yhat_upper': np.vstack([result[2] for result in results]),
+        'residual_variance': np.array([result[3] for result in results]),
+        'fit_diagnostics': pd.DataFrame([result[4] for result in results]),
+    }
+
+#---------------------------------------
+
+def reconcile(summing_matrix, base_forecasts, method, residual_variance=None):
+    """
+    Reconcile base forecasts so every node equals the sum of its children.
+
+    Parameters:
+    summing_matrix : scipy.sparse.csr_matrix
+        From build_summing_matrix.
+    base_forecasts : numpy.ndarray
+        For 'Bottom-up', the bottom level forecasts (num_bottom, horizon).
+        Otherwise the forecasts of every node (num_nodes, horizon).
+    method : str
+        'Bottom-up', 'OLS' or 'MinT (diagonal)'.
+    residual_variance : numpy.ndarray, optional
+        In-sample residual variance of every node, used by MinT.
+
+    Returns:
+    reconciled : numpy.ndarray
+        Coherent forecasts for every node (num_nodes, horizon).
+    """
+    if method == 'Bottom-up':
+        return summing_matrix @ base_forecasts
+
+    if method == 'OLS':
+        weights = np.ones(summing_matrix.shape[0])
+    elif method == 'MinT (diagonal)':
+        #MinT with the covariance estimated by its diagonal (the residual variance
+        #of each node), which keeps every matrix sparse. Floor the variances so
+        #nodes with a perfect in-sample fit do not dominate
+        variance_floor = max(np.nanmean(residual_variance), 1.0) * 1e-6
+        weights = 1 / np.maximum(np.nan_to_num(residual_variance, nan=variance_floor), variance_floor)
+    else:
+        raise ValueError(f"Unsupported reconciliation method. Use one of {RECONCILIATION_METHODS}.")
+
+    #the summing matrix is [C; I], with C summing the bottom level into the
+    #aggregate nodes. Solve (S' W^-1 S) X = S' W^-1 Y for the bottom level using
+    #the Woodbury identity, so only a system the size of the (usually far fewer)
+    #aggregate nodes is factorised, then sum back up the hierarchy
+    num_bottom = summing_matrix.shape[1]
+    if summing_matrix.shape[0] == num_bottom:
+        #no aggregate nodes, so the base forecasts are already coherent
+        return base_forecasts
+    aggregate_matrix = summing_matrix[:-num_bottom]
+    bottom_variance = sparse.diags(1 / weights[-num_bottom:])
+
+    right_hand_side = aggregate_matrix.T @ (weights[:-num_bottom, None] * base_forecasts[:-num_bottom]) + weights[-num_bottom:, None] * base_forecasts[-num_bottom:]
+    scaled_right_hand_side = bottom_variance @ right_hand_side
+    inner_matrix = (sparse.diags(1 / weights[:-num_bottom]) + aggregate_matrix @ bottom_variance @ aggregate_matrix.T).tocsc()
+    correction = splu(inner_matrix).solve(np.asarray(aggregate_matrix @ scaled_right_hand_side))
+    bottom_level = scaled_right_hand_side - bottom_variance @ (aggregate_matrix.T @ correction)
+    return summing_matrix @ bottom_level
+
+#---------------------------------------
+
+def interval_widths(summing_matrix, dict_base, method):
+    """
+    Width of each node's interval below and above its forecast. Intervals are
+    not reconciled: summing the bounds of the series below a node would add
+    up their worst cases and give far too wide an interval. Each fitted node
+    keeps the width from its own model. For 'Bottom-up' only the bottom level
+    is fitted, so the aggregate widths combine the bottom level widths
+    assuming independent errors.
+
+    Returns:
+    lower_width, upper_width : numpy.ndarray
+        Arrays of shape (num_nodes, horizon).
+    """
+    lower_width = np.maximum(dict_base['yhat'] - dict_base['yhat_lower'], 0)
+    upper_width = np.maximum(dict_base['yhat_upper'] - dict_base['yhat'], 0)
+    if method == 'Bottom-up':
+        lower_width = np.sqrt(summing_matrix @ lower_width ** 2)
+        upper_width = np.sqrt(summing_matrix @ upper_width ** 2)
+    return lower_width, upper_width
+
+#---------------------------------------
+
+def calculate_node_thresholds(df_nodes, dict_reconciled, demand_percentile):
+    # Demand threshold and confidence interval at the given percentile for every node.
+    # demand_percentile is a fraction, as held in dict_params
+    df_thresholds = df_nodes.copy()
+    df_thresholds['demand_threshold'] = np.percentile(dict_reconciled['yhat'], demand_percentile * 100, axis=1)
+    df_thresholds['demand_threshold_lower'] = np.percentile(dict_reconciled['yhat_lower'], demand_percentile * 100, axis=1)
+    df_thresholds['demand_threshold_upper'] = np.percentile(dict_reconciled['yhat_upper'], demand_percentile * 100, axis=1)
+    return df_thresholds
+
+#---------------------------------------
+
+def run_hierarchical_forecast(df_long, df_hierarchy, level_columns, series_field, dict_params, method='MinT (diagonal)', max_workers=None):
+    """
+    Forecast and reconcile every node of a service hierarchy.
+
+    Parameters:
+    df_long : pandas.DataFrame
+        History in long format, one row per bottom level series and date.
+    df_hierarchy : pandas.DataFrame
+        One row per bottom level series, with a column per level.
+    level_columns : list
+        Level columns ordered from the top level down; the last one holds
+        the bottom level series named in df_long[series_field].
+    series_field : str
+        Column of df_long identifying the bottom level series.
+    dict_params : dict
+        Model parameters, as per forecast_functions.DEFAULT_PARAMS.
+    method : str
+        Reconciliation method, one of RECONCILIATION_METHODS.
+    max_workers : int, optional
+        Number of processes fitting the base forecasts.
+
+    Returns:
+    dict_results : dict
+        'nodes' (node names and levels, see build_summing_matrix), 'dates' (history dates),
+        'history' (num_nodes, num_dates), 'future_dates', the reconciled
+        'yhat' with its unreconciled 'yhat_lower' / 'yhat_upper' interval
+        (num_nodes, horizon, see interval_widths), the per node 'thresholds'
+        and the 'fit_diagnostics' of every node fitted.
+    """
+    summing_matrix, df_nodes, bottom_series, node_rows = build_summing_matrix(df_hierarchy, level_columns)
+    dates, bottom_history = pivot_bottom_series(
+        df_long,
+        bottom_series,
+        dict_params['datetime_field'],
+        series_field,
+        dict_params['activity_count_field']
+        )
+
+    #missing bottom level values are left to the outlier / interpolation step,
+    #aggregates treat them as zero
+    node_history = summing_matrix @ np.nan_to_num(bottom_history)
+
+    #every node uses 'ds' / 'y' once pivoted
+    dict_node_params = {**dict_params, 'datetime_field': 'ds', 'activity_count_field': 'y'}
+
+    #nodes duplicating another are not fitted, they take the forecast of the node they duplicate
+    df_matrix_nodes = df_nodes.loc[df_nodes['same_as'].isna(), ['node', 'level']]
+    if method == 'Bottom-up':
+        #only the bottom level needs fitting
+        dict_base = forecast_nodes(dates, bottom_history, dict_node_params, max_workers)
+        df_fitted_nodes = df_matrix_nodes.iloc[-len(bottom_series):]
+    else:
+        dict_base = forecast_nodes(dates, node_history, dict_node_params, max_workers)
+        df_fitted_nodes = df_matrix_nodes
+
+    #only the point forecast is reconciled, the intervals are placed around it
+    reconciled = reconcile(summing_matrix, dict_base['yhat'], method, dict_base['residual_variance'])
+    lower_width, upper_width = interval_widths(summing_matrix, dict_base, method)
+    dict_reconciled = {
+        'yhat': reconciled[node_rows],
+        'yhat_lower': (reconciled - lower_width)[node_rows],
+        'yhat_upper': (reconciled + upper_width)[node_rows],
+    }
+
+    future_dates = pd.concat(list(forecast_functions.make_future_dates_in_chunks(
+        dates.max(),
+        dict_params['forecast_horizon'],
+        dict_params['predict_chunk_size'],
+        dict_params['dict_unit_text_to_parameter_term']
+        )))['ds'].values
+
+    return {
+        'nodes': df_nodes,
+        'dates': np.asarray(dates),
+        'history': node_history[node_rows],
+        'future_dates': future_dates,
+        **dict_reconciled,
+        'thresholds': calculate_node_thresholds(df_nodes, dict_reconciled, dict_params['demand_percentile']),
+        'fit_diagnostics': pd.concat([df_fitted_nodes.reset_index(drop=True), dict_base['fit_diagnostics']], axis=1),
+    }
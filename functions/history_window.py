@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from functions import features
+from functions import forecast_functions
+from functions import fit_controls
+
+
+HISTORY_WINDOW_MODES = ['Full history', 'Suggest a window', 'Apply suggested window']
+
+#periods in one seasonal cycle for each unit of measurement. No segment is
+#shorter than a cycle, so seasonal peaks are not mistaken for shifts in demand
+SEASONAL_CYCLE_PERIODS = {
+    'year': 1,
+    'quarter': 4,
+    'month': 12,
+    'week': 52,
+    'day': 365,
+    'hour': 24 * 7,
+    'minute': 60 * 24,
+    'second': 60 * 60,
+}
+
+#a window always keeps at least two seasonal cycles, and never fewer than this many periods
+MIN_WINDOW_PERIODS = 20
+
+#how much a split must reduce the squared error by, in multiples of the noise variance x log(n)
+PENALTY_MULTIPLIER = 3.0
+
+#---------------------------------------
+
+def estimate_noise_variance(values):
+    # Noise variance from the median absolute deviation of the first differences,
+    # which a shift in level barely moves
+    differences = np.diff(values)
+    if len(differences) == 0:
+        return 0.0
+    mad = np.median(np.abs(differences - np.median(differences)))
+    return (1.4826 * mad) ** 2 / 2
+
+def find_best_split(cumulative, start, end, min_segment_length):
+    # Best split of values[start:end] into two segments of different mean, scored
+    # over every candidate split at once from the running totals.
+    # Returns (split position, reduction in squared error), or (None, 0) if too short
+    if end - start < 2 * min_segment_length:
+        return None, 0.0
+
+    num_values = end - start
+    split_positions = np.arange(start + min_segment_length, end - min_segment_length + 1)
+    left_lengths = split_positions - start
+    right_lengths = num_values - left_lengths
+    left_means = (cumulative[split_positions] - cumulative[start]) / left_lengths
+    right_means = (cumulative[end] - cumulative[split_positions]) / right_lengths
+    #written from the difference in means rather than as a difference of squared totals,
+    #which cancel to rounding error (not zero) on segments with no variance
+    gains = left_lengths * right_lengths / num_values * (left_means - right_means) ** 2
+
+    best = np.argmax(gains)
+    return int(split_positions[best]), float(gains[best])
+
+def detect_changepoints(values, min_segment_length, penalty_multiplier=PENALTY_MULTIPLIER):
+    """
+    Find shifts in the level of a series by binary segmentation.
+
+    Parameters:
+    values : numpy.ndarray
+        Cleaned activity counts, in date order.
+    min_segment_length : int
+        Fewest periods allowed between two changepoints.
+    penalty_multiplier : float
+        Higher values find fewer, larger shifts.
+
+    Returns:
+    changepoints : numpy.ndarray
+        Sorted positions where a new level starts.
+    """
+    #missing values are filled from their neighbours, so they neither split the series
+    #nor carry NaN into the running totals and the noise estimate
+    values = pd.Series(np.asarray(values, dtype=float)).interpolate(limit_direction='both').fillna(0).values
+    num_values = len(values)
+    min_segment_length = max(int(min_segment_length), 1)
+    cumulative = np.zeros(num_values + 1)
+    np.cumsum(values, out=cumulative[1:])
+    #piecewise constant history has no noise, so the penalty is floored relative to the
+    #size of the values, above the rounding error of the running totals
+    variance_floor = max(np.mean(values ** 2), 1.0) * 1e-9 if num_values > 0 else 1e-9
+    penalty = penalty_multiplier * max(estimate_noise_variance(values), variance_floor) * np.log(max(num_values, 2))
+
+    #split segments until no split beats the penalty. Every segment is checked
+    #whatever the order, so a simple stack is used rather than ranking by gain
+    changepoints = []
+    segments_to_check = [(0, num_values)]
+    while len(segments_to_check) > 0:
+        start, end = segments_to_check.pop()
+        split_position, gain = find_best_split(cumulative, start, end, min_segment_length)
+        if split_position is None or gain <= penalty:
+            continue
+        changepoints.append(split_position)
+        segments_to_check += [(start, split_position), (split_position, end)]
+
+    return np.sort(np.array(changepoints, dtype=int))
+
+#---------------------------------------
+
+def suggest_history_window(df, datetime_field, activity_count_field, unit_of_measurement):
+    """
+    Suggest the history to fit on: everything since the last shift in the
+    level of demand, keeping at least two seasonal cycles.
+
+    Parameters:
+    df : pandas.DataFrame
+        Cleaned data (after outlier handling), sorted by date.
+    datetime_field, activity_count_field : str
+        Date and activity count columns.
+    unit_of_measurement : str
+        Unit of the series (e.g. 'day', 'week').
+
+    Returns:
+    dict_window : dict
+        'changepoint_dates', 'window_start' (first date to fit on),
+        'num_rows_full' and 'num_rows_window'.
+    """
+    values = df[activity_count_field].values
+    dates = pd.DatetimeIndex(df[datetime_field])
+    cycle_length = SEASONAL_CYCLE_PERIODS[unit_of_measurement]
+    min_window_length = max(2 * cycle_length, MIN_WINDOW_PERIODS)
+
+    changepoints = detect_changepoints(values, min_segment_length=cycle_length)
+
+    #start at the last changepoint, unless that leaves too little history to fit seasonality
+    start_position = int(changepoints[-1]) if len(changepoints) > 0 else 0
+    start_position = max(min(start_position, len(values) - min_window_length), 0)
+
+    return {
+        'changepoint_dates': dates[changepoints],
+        'window_start': dates[start_position],
+        'num_rows_full': len(values),
+        'num_rows_window': len(values) - start_position,
+    }
+
+def apply_history_window(df, datetime_field, window_start):
+    # Keep the rows from window_start onwards
+    return df[df[datetime_field] >= window_start].reset_index(drop=True)
+
+#---------------------------------------
+
+def _fit_and_score(df_train, df_test, dict_params):
+    # Fit on df_train, score the forecast of df_test. Returns the fit time and accuracy
+    feature_set = forecast_functions.build_feature_set_for_params(df_train, dict_params)
+    model = Prophet(interval_width=dict_params['confidence_limit'])
+    if feature_set is not None:
+        df_train = features.add_features(df_train, feature_set)
+        df_test = features.add_features(df_test, feature_set)
+        for column in feature_set['columns']:
+            model.add_regressor(column)
+
+    dict_fit_diagnostics = fit_controls.fit_model(model, df_train, dict_params)
+
+    forecast = model.predict(df_test.drop(columns='y'))
+    actuals = df_test['y'].values
+    errors = forecast['yhat'].values - actuals
+    return {
+        'rows_fitted': len(df_train),
+        'fit_seconds': dict_fit_diagnostics['total_seconds'],
+        'mae': np.mean(np.abs(errors)),
+        'wape': np.sum(np.abs(errors)) / max(np.sum(np.abs(actuals)), 1e-9),
+        'bias': np.mean(errors),
+        'interval_coverage': np.mean((actuals >= forecast['yhat_lower'].values) & (actuals <= forecast['yhat_upper'].values)),
+    }
+
+def backtest_history_window(df, window_start, dict_params, holdout_periods=None):
+    """
+    Compare fitting on a suggested window with fitting on the full history,
+    by holding back the most recent periods and forecasting them with each.
+    The window is suggested again from the training periods only, so the
+    held back periods play no part in choosing it.
+
+    Parameters:
+    df : pandas.DataFrame
+        Cleaned data with 'ds' and 'y' columns, full history.
+    window_start : pandas.Timestamp
+        First date of the window suggested from the full history, used to
+        size the holdout.
+    dict_params : dict
+        Model parameters.
+    holdout_periods : int, optional
+        Periods held back. Defaults to the forecast horizon, capped at a
+        fifth of the window.
+
+    Returns:
+    df_backtest : pandas.DataFrame
+        One row per training history: rows fitted, fit seconds, mean absolute
+        error, weighted absolute percentage error, bias and interval coverage
+        on the held back periods, and the 'window_start' fitted from.
+    """
+    df = df[['ds', 'y']]
+    num_rows_window = int((df['ds'] >= window_start).sum())
+    if holdout_periods is None:
+        holdout_periods = min(int(dict_params['forecast_horizon']), num_rows_window // 5)
+    holdout_periods = max(int(holdout_periods), 1)
+
+    df_train = df.iloc[:-holdout_periods].reset_index(drop=True)
+    df_test = df.iloc[-holdout_periods:].reset_index(drop=True)
+    train_window_start = suggest_history_window(df_train, 'ds', 'y', dict_params['unit_of_measurement'])['window_start']
+
+    dict_full = _fit_and_score(df_train, df_test, dict_params)
+    dict_window = _fit_and_score(apply_history_window(df_train, 'ds', train_window_start), df_test, dict_params)
+
+    df_backtest = pd.DataFrame([dict_full, dict_window], index=['Full history', 'Suggested window'])
+    df_backtest['window_start'] = [df_train['ds'].iloc[0], train_window_start]
+    df_backtest['holdout_periods'] = holdout_periods
+    return df_backtest
@@ -0,0 +1,26 @@
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+
+#session state key holding the stage timings of the latest script run
+STAGE_TIMINGS_KEY = 'stage_timings'
+
+#---------------------------------------
+
+def reset_stage_timings():
+    # Start a fresh set of timings for this script run
+    st.session_state[STAGE_TIMINGS_KEY] = {}
+
+@contextmanager
+def time_stage(stage):
+    # Record how long the wrapped block takes, in seconds, against the stage name.
+    # Timings are kept in the session so load tests (and planners) can read them
+    # after the run, a stage entered twice in one run accumulates
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        dict_timings = st.session_state.setdefault(STAGE_TIMINGS_KEY, {})
+        dict_timings[stage] = dict_timings.get(stage, 0.0) + time.perf_counter() - start
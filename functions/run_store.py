@@ -0,0 +1,232 @@
+import sqlite3
+import hashlib
+import json
+import os
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from functions import export
+from functions import forecast_functions
+
+
+#default location of the run store, relative to where the app is launched
+DEFAULT_STORE_DIR = 'forecast_runs'
+
+#---------------------------------------
+
+def fingerprint_inputs(df, datetime_field, activity_count_field):
+    # Hash the date and activity count columns, so an unchanged upload gives
+    # the same fingerprint however the file was named or ordered on disk
+    hashed_rows = pd.util.hash_pandas_object(df[[datetime_field, activity_count_field]], index=False)
+    return hashlib.sha256(hashed_rows.values.tobytes()).hexdigest()
+
+#---------------------------------------
+
+def serialise_params(dict_params):
+    # The data itself is recorded by its fingerprint, not stored with the params.
+    # Other frames (holiday calendars, regressors) are stored as a hash of their contents
+    dict_to_store = {
+        key: (hashlib.sha256(pd.util.hash_pandas_object(value, index=False).values.tobytes()).hexdigest() if isinstance(value, pd.DataFrame) else value)
+        for key, value in dict_params.items() if key != 'df'
+    }
+    return json.dumps(dict_to_store, sort_keys=True, default=str)
+
+def hash_params(dict_params):
+    # Only the params that change the forecast are hashed, so e.g. a new export
+    # format still finds the stored run
+    dict_forecast_params = {key: value for key, value in dict_params.items() if key in forecast_functions.FORECAST_PARAM_KEYS}
+    return hashlib.sha256(serialise_params(dict_forecast_params).encode('utf-8')).hexdigest()
+
+#---------------------------------------
+
+def connect(store_dir=DEFAULT_STORE_DIR):
+    # Open the run store, creating the folder, table and indexes on first use
+    os.makedirs(os.path.join(store_dir, 'runs'), exist_ok=True)
+    conn = sqlite3.connect(os.path.join(store_dir, 'runs.sqlite'))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            series_name TEXT NOT NULL,
+            run_time TEXT NOT NULL,
+            input_fingerprint TEXT NOT NULL,
+            params_hash TEXT NOT NULL,
+            params_json TEXT NOT NULL,
+            demand_percentile REAL,
+            demand_threshold REAL,
+            demand_threshold_lower REAL,
+            demand_threshold_upper REAL,
+            forecast_path TEXT NOT NULL,
+            data_path TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_series_time ON runs (series_name, run_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_params ON runs (params_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_inputs ON runs (series_name, input_fingerprint, params_hash)")
+    return conn
+
+#---------------------------------------
+
+class RunForecastWriter(export.ExportWriter):
+    """
+    Parquet writer for the forecast of a new run, so the full horizon can be
+    streamed into the store as it is predicted (pass write as predict_in_chunks'
+    on_chunk) rather than kept in memory. Hand it to save_run to finish the run,
+    or call discard if the run fails. Rows go to a '.partial' file, which
+    save_run moves into place, so a failed run never looks like a stored one.
+
+    Parameters:
+    store_dir : str
+        Folder holding the run store.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.run_time = datetime.now()
+        self.run_id = f"{self.run_time.strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.join(store_dir, 'runs'), exist_ok=True)
+        self.path = os.path.join(store_dir, 'runs', f'{self.run_id}_forecast.parquet')
+        super().__init__(self.path + '.partial', 'Parquet')
+
+    def discard(self):
+        # Drop the partial file of a run that was not saved. Does nothing once saved
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self.target):
+            os.remove(self.target)
+
+#---------------------------------------
+
+def save_run(series_name, input_fingerprint, dict_params, forecast, dict_thresholds, df_cleaned=None, store_dir=DEFAULT_STORE_DIR, forecast_writer=None):
+    """
+    Record a forecast run in the run store.
+
+    Parameters:
+    series_name : str
+        Name of the series forecast (e.g. the uploaded file name).
+    input_fingerprint : str
+        Fingerprint of the input data, from fingerprint_inputs.
+    dict_params : dict
+        Parameters returned by the sidebar.
+    forecast : pandas.DataFrame
+        The forecast frame, including the component columns. If a
+        forecast_writer is given, only the rows not yet written to it
+        (e.g. the fitted history).
+    dict_thresholds : dict
+        Demand threshold summary with keys 'demand_threshold',
+        'demand_threshold_lower' and 'demand_threshold_upper'.
+    df_cleaned : pandas.DataFrame, optional
+        The data after outlier handling and interpolation.
+    store_dir : str
+        Folder holding the run store.
+    forecast_writer : RunForecastWriter, optional
+        Writer the future has already been streamed into. It is closed here.
+
+    Returns:
+    run_id : str
+        Identifier of the stored run.
+    """
+    if forecast_writer is None:
+        forecast_writer = RunForecastWriter(store_dir)
+    run_time = forecast_writer.run_time
+    run_id = forecast_writer.run_id
+    forecast_path = forecast_writer.path
+
+    with forecast_writer:
+        for chunk in export.iter_chunks(forecast):
+            forecast_writer.write(chunk)
+    os.replace(forecast_writer.target, forecast_path)
+
+    #connecting first also creates the store folders if needed
+    with closing(connect(store_dir)) as conn, conn:
+
+        data_path = None
+        if df_cleaned is not None:
+            data_path = os.path.join(store_dir, 'runs', f'{run_id}_data.parquet')
+            df_cleaned.to_parquet(data_path, index=False)
+
+        conn.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                series_name,
+                run_time.isoformat(timespec='seconds'),
+                input_fingerprint,
+                hash_params(dict_params),
+                serialise_params(dict_params),
+                dict_params.get('demand_percentile'),
+                float(dict_thresholds['demand_threshold']),
+                float(dict_thresholds['demand_threshold_lower']),
+                float(dict_thresholds['demand_threshold_upper']),
+                forecast_path,
+                data_path
+            )
+        )
+
+    return run_id
+
+#---------------------------------------
+
+def list_runs(series_name=None, params_hash=None, store_dir=DEFAULT_STORE_DIR):
+    # Summary of stored runs, most recent first, optionally filtered by series / parameter set
+    query = """SELECT run_id, series_name, run_time, input_fingerprint, params_hash,
+        demand_percentile, demand_threshold, demand_threshold_lower, demand_threshold_upper
+        FROM runs"""
+    conditions = []
+    values = []
+    if series_name is not None:
+        conditions.append('series_name = ?')
+        values.append(series_name)
+    if params_hash is not None:
+        conditions.append('params_hash = ?')
+        values.append(params_hash)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY run_time DESC'
+
+    with closing(connect(store_dir)) as conn:
+        return pd.read_sql_query(query, conn, params=values)
+
+#---------------------------------------
+
+def find_run(series_name, input_fingerprint, dict_params, store_dir=DEFAULT_STORE_DIR):
+    # Most recent run of this series with identical inputs and parameters, or None.
+    # Lets batch jobs skip series whose inputs have not changed
+    with closing(connect(store_dir)) as conn:
+        row = conn.execute(
+            """SELECT run_id FROM runs
+            WHERE series_name = ? AND input_fingerprint = ? AND params_hash = ?
+            ORDER BY run_time DESC LIMIT 1""",
+            (series_name, input_fingerprint, hash_params(dict_params))
+        ).fetchone()
+    return row[0] if row is not None else None
+
+#---------------------------------------
+
+def load_run(run_id, store_dir=DEFAULT_STORE_DIR):
+    # Reopen a stored run without refitting: returns a dictionary holding the
+    # run summary, its parameters, the forecast frame and the cleaned data (if stored)
+    with closing(connect(store_dir)) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"No stored run with id '{run_id}'.")
+
+    dict_run = dict(row)
+    dict_run['params'] = json.loads(dict_run.pop('params_json'))
+    #streamed runs store the future before the fitted history
+    dict_run['forecast'] = pd.read_parquet(dict_run['forecast_path']).sort_values('ds', kind='stable').reset_index(drop=True)
+    if dict_run['data_path'] is not None and os.path.exists(dict_run['data_path']):
+        dict_run['data'] = pd.read_parquet(dict_run['data_path'])
+    else:
+        dict_run['data'] = None
+    return dict_run
+
+def future_forecast(dict_run):
+    # The forecast periods after the history of a run from load_run. Without the
+    # stored data the history cannot be told apart, so the whole forecast is returned
+    if dict_run['data'] is None:
+        return dict_run['forecast']
+    return dict_run['forecast'][dict_run['forecast']['ds'] > dict_run['data']['ds'].max()]
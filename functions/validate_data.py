@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pandas.tseries.api import guess_datetime_format
+
+
+#date formats tried, in order, when inferring the format of the date/time field.
+#day-first formats are tried before month-first, so ambiguous dates such as
+#01/02/2024 are read as 1st February
+CANDIDATE_DATETIME_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M:%S',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d-%m-%Y',
+    '%Y/%m/%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%Y-%m',
+]
+
+#a UTC offset or zone name after the time of a date/time string, e.g. '09:00+01:00'
+#or '09:00:00Z'. Prophet needs time zone naive dates, so these are removed
+TIMEZONE_SUFFIX_PATTERN = r'(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|UTC|[+-]\d{2}:?\d{2})$'
+
+#---------------------------------------
+
+def infer_datetime_format(values, sample_size=500):
+    """
+    Infer the format of a column of date strings from a sample of its values.
+
+    Parameters:
+    values : pandas.Series
+        The date/time values, as read from the file.
+    sample_size : int
+        Number of values, spread evenly across the column, to test.
+
+    Returns:
+    datetime_format : str or None
+        The first format that parses every sampled value, otherwise the
+        format parsing most of them, or None if no format fits the majority.
+    """
+    values = values.dropna().astype(str).str.strip()
+    values = values[values != '']
+    if len(values) == 0:
+        return None
+
+    #sample across the whole column, so a change of format part way through is caught
+    sample_positions = np.unique(np.linspace(0, len(values) - 1, min(sample_size, len(values))).astype(int))
+    sample = values.iloc[sample_positions]
+
+    candidate_formats = list(CANDIDATE_DATETIME_FORMATS)
+    guessed_format = guess_datetime_format(sample.iloc[0], dayfirst=not sample.iloc[0][:4].isdigit())
+    if guessed_format is not None and guessed_format not in candidate_formats:
+        candidate_formats.append(guessed_format)
+
+    #pick the format matching the most sampled values. Any values it does not
+    #match are reported by validate_and_parse
+    best_format = None
+    best_num_parsed = 0
+    for datetime_format in candidate_formats:
+        num_parsed = pd.to_datetime(sample, format=datetime_format, errors='coerce').notna().sum()
+        if num_parsed == len(sample):
+            return datetime_format
+        if num_parsed > best_num_parsed:
+            best_format, best_num_parsed = datetime_format, num_parsed
+
+    if best_num_parsed > len(sample) / 2:
+        return best_format
+    return None
+
+#---------------------------------------
+
+def validate_and_parse(df, datetime_field, activity_count_field):
+    """
+    Validate an uploaded data set and parse it once, before any model work.
+
+    The date/time field is parsed with a single explicit format inferred from
+    a sample, the activity count field is coerced to a numeric dtype, and the
+    data is sorted by date with duplicate timestamps reported.
+
+    Parameters:
+    df : pandas.DataFrame
+        The data set as read from the file.
+    datetime_field : str
+        Name of the date/time field.
+    activity_count_field : str
+        Name of the field containing activity counts.
+
+    Returns:
+    df_parsed : pandas.DataFrame
+        The parsed data, sorted by date with a fresh index.
+    dict_report : dict
+        'errors' (problems that prevent the model running), 'warnings'
+        (problems handled automatically) and the 'datetime_format' used.
+    """
+    dict_report = {'errors': [], 'warnings': [], 'datetime_format': None}
+
+    if datetime_field == activity_count_field:
+        dict_report['errors'].append('The date/time field and the activity count field must be different columns.')
+        return df, dict_report
+
+    if len(df) == 0:
+        dict_report['errors'].append('The data set contains no rows.')
+        return df, dict_report
+
+    df_parsed = df.copy()
+
+    num_missing_dates = df_parsed[datetime_field].isna().sum()
+    if num_missing_dates > 0:
+        dict_report['errors'].append(f"{num_missing_dates} row(s) have no value in '{datetime_field}'.")
+
+    #parse the date/time field once, vectorised with an explicit format
+    if not pd.api.types.is_datetime64_any_dtype(df_parsed[datetime_field]):
+        #keep the local time of values with a time zone, dropping the zone
+        datetime_text = df_parsed[datetime_field].astype(str)
+        datetime_text_without_timezone = datetime_text.str.replace(TIMEZONE_SUFFIX_PATTERN, r'\1', regex=True)
+        has_timezone = (datetime_text_without_timezone != datetime_text) & df_parsed[datetime_field].notna()
+        if has_timezone.any():
+            dict_report['warnings'].append(
+                f"{has_timezone.sum()} value(s) in '{datetime_field}' include a time zone. "
+                "The time zone has been removed, keeping the local date and time."
+            )
+            df_parsed.loc[has_timezone, datetime_field] = datetime_text_without_timezone[has_timezone]
+        datetime_format = infer_datetime_format(df_parsed[datetime_field])
+        if datetime_format is None:
+            dict_report['errors'].append(
+                f"Could not recognise a single date format in '{datetime_field}' "
+                f"(first value: '{df_parsed[datetime_field].iloc[0]}'). Please make sure all dates use the same format."
+            )
+            return df_parsed, dict_report
+        dict_report['datetime_format'] = datetime_format
+        original_values = df_parsed[datetime_field]
+        df_parsed[datetime_field] = pd.to_datetime(original_values, format=datetime_format, errors='coerce')
+
+        unparsed = df_parsed[datetime_field].isna() & original_values.notna()
+        if unparsed.any():
+            examples = ', '.join(f"'{value}'" for value in original_values[unparsed].astype(str).unique()[:3])
+            dict_report['errors'].append(
+                f"{unparsed.sum()} value(s) in '{datetime_field}' do not match the date format of the rest "
+                f"of the file ({datetime_format}), for example {examples}."
+            )
+    elif df_parsed[datetime_field].dt.tz is not None:
+        dict_report['warnings'].append(
+            f"'{datetime_field}' has a time zone ({df_parsed[datetime_field].dt.tz}). "
+            "The time zone has been removed, keeping the local date and time."
+        )
+        df_parsed[datetime_field] = df_parsed[datetime_field].dt.tz_localize(None)
+
+    #coerce the activity counts to numbers. Anything non-numeric is treated as missing
+    #and filled by the chosen interpolation method
+    original_counts = df_parsed[activity_count_field]
+    df_parsed[activity_count_field] = pd.to_numeric(original_counts, errors='coerce')
+    non_numeric = df_parsed[activity_count_field].isna() & original_counts.notna()
+    if non_numeric.any():
+        dict_report['warnings'].append(
+            f"{non_numeric.sum()} value(s) in '{activity_count_field}' are not numbers. "
+            "These will be treated as missing and replaced using your chosen interpolation method."
+        )
+    elif not pd.api.types.is_numeric_dtype(original_counts):
+        dict_report['warnings'].append(f"'{activity_count_field}' was read as text and has been converted to numbers.")
+
+    #sort the series by date. Dates that could not be read are reported above, so
+    #only the valid dates are checked for order
+    if not df_parsed[datetime_field].dropna().is_monotonic_increasing:
+        dict_report['warnings'].append(f"The data was not in date order and has been sorted by '{datetime_field}'.")
+        df_parsed = df_parsed.sort_values(by=datetime_field, kind='stable')
+    df_parsed = df_parsed.reset_index(drop=True)
+
+    #duplicate timestamps mean the data is not an aggregate count per time unit
+    duplicated = df_parsed[datetime_field].duplicated(keep=False) & df_parsed[datetime_field].notna()
+    if duplicated.any():
+        examples = ', '.join(str(value) for value in df_parsed.loc[duplicated, datetime_field].unique()[:3])
+        dict_report['errors'].append(
+            f"{df_parsed.loc[duplicated, datetime_field].nunique()} date/time value(s) appear more than once, "
+            f"for example {examples}. The file should contain a single aggregate count per time unit."
+        )
+
+    return df_parsed, dict_report
+
+#---------------------------------------
+
+@st.cache_data(show_spinner='Checking your data...')
+def validate_and_parse_cached(df, datetime_field, activity_count_field):
+    # Cached so the upload is only parsed once, rather than on every rerun of the app
+    return validate_and_parse(df, datetime_field, activity_count_field)
@@ -0,0 +1,280 @@
+"""
+Load test for the streamlit app.
+
+Simulates planners using main.py at the same time. Each session opens the
+app, sets the size of its (synthetic) data set, then every session presses
+"Run model" together and moves the capacity planner once the forecast is
+back. Reports latency per stage, CPU and memory, and failures, so a
+deployment can be sized and contention in the fit path spotted.
+
+Streamlit's AppTest runs one app per process, so each session is its own
+process. Stages inside the app are timed by functions/profiling.py.
+
+Run with:
+    python load_test_app.py --sessions 10 --days 365,1095,3650 --baseline
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+#---------------------------------------
+
+def get_resource_usage():
+    # CPU seconds used by this session and the processes it started (cmdstan), the
+    # session's own peak memory and the peak of its largest finished child process.
+    # Children are reported separately as the OS only keeps the largest child's peak,
+    # not their total
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_seconds': usage_self.ru_utime + usage_self.ru_stime + usage_children.ru_utime + usage_children.ru_stime,
+        'peak_memory_mb': usage_self.ru_maxrss / 1024,
+        'peak_child_memory_mb': usage_children.ru_maxrss / 1024,
+    }
+
+def run_session(session_number, num_days, store_dir, timeout, start_barrier, result_queue):
+    # One simulated planner. Puts a list of (stage, seconds) rows and a status record on the queue
+    from streamlit.testing.v1 import AppTest
+
+    #every session writes to the same run store, as on a shared deployment
+    os.chdir(store_dir)
+    list_timings = []
+    dict_session = {'session': session_number, 'num_days': num_days, 'status': 'ok', 'error': None}
+    reached_barrier = False
+
+    def record(stage, seconds):
+        list_timings.append({'session': session_number, 'num_days': num_days, 'stage': stage, 'seconds': seconds})
+
+    def check(app_test, stage):
+        if len(app_test.exception) > 0:
+            raise RuntimeError(f'{stage}: {app_test.exception[0].value}')
+
+    try:
+        app_test = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+        start = time.perf_counter()
+        app_test.run()
+        record('page_load', time.perf_counter() - start)
+        check(app_test, 'page_load')
+
+        app_test.number_input(key='test_data_days').set_value(num_days)
+        start = time.perf_counter()
+        app_test.run()
+        record('upload', time.perf_counter() - start)
+        check(app_test, 'upload')
+
+        #every session presses "Run model" at once
+        reached_barrier = True
+        start_barrier.wait(timeout=timeout)
+        start = time.perf_counter()
+        app_test.sidebar.button[0].click().run()
+        record('run_model', time.perf_counter() - start)
+        check(app_test, 'run_model')
+        for stage, seconds in app_test.session_state['stage_timings'].items():
+            record(stage, seconds)
+        if not any('has been saved with id' in markdown.value for markdown in app_test.markdown):
+            raise RuntimeError('run_model: the run finished without a saved forecast')
+
+        capacity_slider = [slider for slider in app_test.slider if slider.label == 'Plan capacity at percentile of demand'][0]
+        start = time.perf_counter()
+        capacity_slider.set_value(95).run()
+        record('capacity_planner', time.perf_counter() - start)
+        check(app_test, 'capacity_planner')
+
+    except Exception as error:
+        dict_session['status'] = 'failed'
+        dict_session['error'] = f'{type(error).__name__}: {error}'
+        traceback.print_exc()
+        if not reached_barrier:
+            #still arrive at the barrier, so the other sessions are not held up
+            try:
+                start_barrier.wait(timeout=timeout)
+            except Exception:
+                pass
+
+    dict_session.update(get_resource_usage())
+    result_queue.put((list_timings, dict_session))
+
+#---------------------------------------
+
+class ResourceSampler:
+    """
+    Samples the CPU and memory of the whole machine while the sessions run.
+    Uses psutil if it is installed, otherwise /proc (Linux only).
+
+    Parameters:
+    interval : float
+        Seconds between samples.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _read(self):
+        try:
+            import psutil
+            return {'cpu_percent': psutil.cpu_percent(interval=None), 'memory_used_mb': psutil.virtual_memory().used / 1024 ** 2}
+        except ImportError:
+            pass
+
+        with open('/proc/stat') as file:
+            cpu_times = [float(value) for value in file.readline().split()[1:]]
+        with open('/proc/meminfo') as file:
+            dict_memory = {line.split(':')[0]: float(line.split()[1]) for line in file}
+        idle = cpu_times[3] + cpu_times[4]
+        cpu_percent = None
+        if getattr(self, '_previous_cpu', None) is not None:
+            total_change = sum(cpu_times) - sum(self._previous_cpu[0])
+            cpu_percent = 100 * (1 - (idle - self._previous_cpu[1]) / total_change) if total_change > 0 else 0.0
+        self._previous_cpu = (cpu_times, idle)
+        return {'cpu_percent': cpu_percent, 'memory_used_mb': (dict_memory['MemTotal'] - dict_memory['MemAvailable']) / 1024}
+
+    def _run(self):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                sample = self._read()
+            except OSError:
+                return
+            sample['elapsed'] = time.perf_counter() - start
+            self.samples.append(sample)
+            self._stop.wait(self.interval)
+
+    def summary(self):
+        df_samples = pd.DataFrame(self.samples).dropna()
+        if len(df_samples) == 0:
+            return None
+        return {
+            'cpu_percent_mean': df_samples['cpu_percent'].mean(),
+            'cpu_percent_max': df_samples['cpu_percent'].max(),
+            'memory_used_mb_start': df_samples['memory_used_mb'].iloc[0],
+            'memory_used_mb_max': df_samples['memory_used_mb'].max(),
+        }
+
+#---------------------------------------
+
+def run_sessions(list_days, store_dir, timeout):
+    # Run one process per entry of list_days at the same time. Returns (df_timings, df_sessions, dict_resources)
+    context = multiprocessing.get_context('spawn')
+    start_barrier = context.Barrier(len(list_days))
+    result_queue = context.Queue()
+    processes = [
+        context.Process(target=run_session, args=(session_number, num_days, store_dir, timeout, start_barrier, result_queue))
+        for session_number, num_days in enumerate(list_days)
+    ]
+
+    list_timings = []
+    list_sessions = []
+    with ResourceSampler() as sampler:
+        for process in processes:
+            process.start()
+        #read the results before joining, so a full queue cannot block a session from exiting
+        for _ in processes:
+            try:
+                timings, dict_session = result_queue.get(timeout=timeout * 4)
+            except Exception:
+                break
+            list_timings += timings
+            list_sessions.append(dict_session)
+        for process in processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+
+    #sessions that died without reporting (e.g. killed for memory) count as failures
+    reported_sessions = {dict_session['session'] for dict_session in list_sessions}
+    for session_number, (process, num_days) in enumerate(zip(processes, list_days)):
+        if session_number not in reported_sessions:
+            list_sessions.append({'session': session_number, 'num_days': num_days, 'status': 'failed', 'error': f'process exited with code {process.exitcode}'})
+
+    df_timings = pd.DataFrame(list_timings, columns=['session', 'num_days', 'stage', 'seconds'])
+    df_sessions = pd.DataFrame(list_sessions).sort_values('session').reset_index(drop=True)
+    return df_timings, df_sessions, sampler.summary()
+
+def summarise_timings(df_timings):
+    # p50 / p95 / max latency per stage and data size
+    return df_timings.groupby(['stage', 'num_days'], sort=False)['seconds'].agg(
+        sessions='count',
+        p50=lambda seconds: np.percentile(seconds, 50),
+        p95=lambda seconds: np.percentile(seconds, 95),
+        max='max'
+        ).round(2)
+
+#---------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the streamlit app with concurrent sessions.')
+    parser.add_argument('--sessions', type=int, default=10, help='Number of concurrent sessions.')
+    parser.add_argument('--days', default='365,1095,3650', help='Comma separated data set sizes (days of history), cycled across sessions.')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds allowed for each step of a session.')
+    parser.add_argument('--baseline', action='store_true', help='First run one session per data set size on its own, to measure the slowdown under load.')
+    parser.add_argument('--store-dir', default=None, help='Directory the sessions save their runs to. A temporary directory if not set.')
+    parser.add_argument('--output', default=None, help='Write the per session stage timings to this csv file.')
+    args = parser.parse_args()
+
+    sizes = [int(days) for days in args.days.split(',')]
+    list_days = [sizes[session_number % len(sizes)] for session_number in range(args.sessions)]
+    store_dir = os.path.abspath(args.store_dir) if args.store_dir else tempfile.mkdtemp(prefix='load_test_app_')
+    os.makedirs(store_dir, exist_ok=True)
+    print(f'Run store: {store_dir}')
+
+    df_baseline_summary = None
+    if args.baseline:
+        list_baseline_timings = []
+        for num_days in sizes:
+            df_timings, _, _ = run_sessions([num_days], store_dir, args.timeout)
+            list_baseline_timings.append(df_timings)
+        df_baseline_summary = summarise_timings(pd.concat(list_baseline_timings))
+
+    start = time.perf_counter()
+    df_timings, df_sessions, dict_resources = run_sessions(list_days, store_dir, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    df_summary = summarise_timings(df_timings)
+    if df_baseline_summary is not None:
+        #how much slower each stage is with every session running at once
+        df_summary['baseline'] = df_baseline_summary['p50'].reindex(df_summary.index)
+        df_summary['slowdown'] = (df_summary['p50'] / df_summary['baseline'].replace(0, np.nan)).round(2)
+
+    num_failed = int((df_sessions['status'] != 'ok').sum())
+    print(f'\nSessions: {len(df_sessions)} ({num_failed} failed) in {elapsed:.1f}s')
+    print('\nLatency per stage (seconds):')
+    print(df_summary.to_string())
+    print('\nPer session:')
+    print(df_sessions.drop(columns='error').round(1).to_string(index=False))
+    if dict_resources is not None:
+        print('\nMachine while running:')
+        print(f"CPU: {dict_resources['cpu_percent_mean']:.0f}% mean, {dict_resources['cpu_percent_max']:.0f}% max")
+        print(f"Memory used: {dict_resources['memory_used_mb_start']:.0f} MB at start, {dict_resources['memory_used_mb_max']:.0f} MB max")
+    for _, row in df_sessions[df_sessions['status'] != 'ok'].iterrows():
+        print(f"Session {row['session']} failed: {row['error']}")
+
+    if args.output is not None:
+        df_timings.to_csv(args.output, index=False)
+        print(f'\nStage timings written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Load test for the local forecast service.
+
+Sends concurrent forecast requests to a running forecast_service.py and
+reports p50 / p99 latency and throughput.
+
+Run with:
+    python load_test_service.py --url http://127.0.0.1:8502 --concurrency 8 --requests 64
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def create_payload(series_number, num_rows, forecast_horizon, output_format):
+    # Synthetic daily series, seeded so repeat requests for a series are identical
+    rng = np.random.default_rng(series_number)
+    df = pd.DataFrame({
+        'ds': pd.date_range(start='2020-01-01', periods=num_rows, freq='D').strftime('%Y-%m-%d'),
+        'y': rng.poisson(lam=50, size=num_rows)
+    })
+    return json.dumps({
+        'data': df.to_dict(orient='records'),
+        'params': {'forecast_horizon': forecast_horizon},
+        'format': output_format
+    }, default=int).encode('utf-8')
+
+
+def send_request(url, payload):
+    # Returns (latency in seconds, response size in bytes, error or None)
+    start = time.perf_counter()
+    try:
+        request = urllib.request.Request(f'{url}/forecast', data=payload, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            num_bytes = len(response.read())
+        return time.perf_counter() - start, num_bytes, None
+    except Exception as error:
+        return time.perf_counter() - start, 0, str(error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the local forecast service.')
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=64, help='Total number of requests to send.')
+    parser.add_argument('--series', type=int, default=8, help='Number of distinct series requested (repeats hit the fit cache).')
+    parser.add_argument('--rows', type=int, default=3 * 365, help='Rows of history per series.')
+    parser.add_argument('--horizon', type=int, default=90, help='Forecast horizon per request.')
+    parser.add_argument('--format', default='ndjson', choices=['ndjson', 'json', 'arrow'])
+    args = parser.parse_args()
+
+    payloads = [create_payload(series_number, args.rows, args.horizon, args.format) for series_number in range(args.series)]
+
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(request_number):
+        result = send_request(args.url, payloads[request_number % args.series])
+        with results_lock:
+            results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _, error in results if error is None])
+    errors = [error for _, _, error in results if error is not None]
+
+    print(f'Requests: {len(results)} ({len(errors)} failed) in {elapsed:.2f}s')
+    print(f'Throughput: {len(latencies) / elapsed:.2f} requests/s')
+    if len(latencies) > 0:
+        print(f'Latency p50: {np.percentile(latencies, 50) * 1000:.0f} ms')
+        print(f'Latency p99: {np.percentile(latencies, 99) * 1000:.0f} ms')
+        print(f'Mean response size: {np.mean([size for _, size, error in results if error is None]) / 1024:.1f} KB')
+    for error in sorted(set(errors)):
+        print(f'Error: {error}')
+
+    try:
+        with urllib.request.urlopen(f'{args.url}/health', timeout=10) as response:
+            print(f"Service stats: {json.loads(response.read())['stats']}")
+    except Exception:
+        pass
+
+
+if __name__ == '__main__':
+    main()
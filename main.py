@@ -1,171 +1,392 @@
-import streamlit as st
-import numpy as np
-from prophet import Prophet
-import matplotlib.pyplot as plt
-
-#import modules
-from functions import sidebar
-from functions import detect_outliers as outliers
-from functions import plots
-from functions import render_warnings
-from functions import forecast_functions
-
-st.set_page_config(layout='wide', initial_sidebar_state='expanded')
-
-#render the sidebar by calling the relevant function
-#This will return all parameters as a dictionary
-#try:
-#    dict_params = sidebar.render_sidebar()
-#except:
-#    st.stop()
-
-
-
-st.title(':green[Demand forecasting]')
-
-st.subheader(':green[How to get started:]')
-with st.expander(label='Click for overview'):
-    st.subheader('Purpose:')
-    st.write('This app is intended to support demand and capacity planning. It uses the Meta Prophet library to do this.')
-    st.subheader('Getting started')
-    st.write('To get started, set up the parameters for your demand forecasting model using the options in the sidebar 👈🏻. Once you are happy with the parameter selections, press "Run model" button.')
-
-try:
-    dict_params = sidebar.render_sidebar()
-    #test print for model params - remove in final
-    #st.write(dict_params)
-except:
-    render_warnings.render_warning_aggregate_activity_count()
-    st.write('Please select the file you wish to use, using the "Browse files" button in the sidebar to the left 👈🏻')
-    st.stop()
-
-st.subheader(':green[Preview of your data set]')
-with st.expander('Click to view your data set'):
-    st.dataframe(dict_params['df'])
-
-#add button to run the model
-with st.sidebar:
-    button_run_model = st.button(label='Run model')
-
-#button_run_model = True
-if button_run_model:
-
-    st.subheader(':green[Outlier detection and interpolation]')
-
-    #ID outliers
-    outlier_results = outliers.detect_outliers(
-        dict_params['df'], 
-        method=dict_params['outlier_detection_method'], 
-        threshold=dict_params['outlier_detection_method_threshold']
-        ) 
-
-    #st.write(outlier_results)
-
-    #function call to check presence of outliers using user method, render findings and 
-    #advise user what they should do if outliers present
-    #if outliers were detected and removed, advise the user of the number of outliers removed
-    #and confirm the method applied to handle the gaps in data
-    #similarly, advise if any data missing, volume of this, and method applied. 
-    df_outliers_and_missing_values_interpolated = outliers.process_and_visualize_outliers(
-        dict_params['df'], 
-        outlier_results, 
-        dict_params['datetime_field'], 
-        dict_params['activity_count_field'],
-        dict_params['outlier_handling_method_argument'],
-        dict_params['outlier_handling_method'],
-        dict_params['dict_unit_text_to_parameter_term'],
-        dict_params['polynomial_degree_value']
-        )
-
-
-    st.subheader(':green[Fitting the model]')
-    #create the model
-    model = Prophet(interval_width=dict_params['confidence_limit'])
-
-    #fit the model to the dataset
-    model.fit(df_outliers_and_missing_values_interpolated)
-
-    #Make future predictions
-    future = model.make_future_dataframe(periods=dict_params['forecast_horizon'])  # Prediction horizon according to user selection
-
-    forecast = model.predict(future)
-
-    chart_forecast = plots.plot_forecast_with_components(df_outliers_and_missing_values_interpolated, forecast, dict_params['datetime_field'])
-
-    #render the chart
-    #st.altair_chart(chart_forecast, use_container_width=True)
-
-
-    #get model components (Charts and explanations)
-    dict_component_charts, dict_of_explanations_for_charts = plots.create_dict_of_component_charts(dict_params['datetime_field'], forecast)
-
-    #set up the tabs to render all outputs
-    # Begin a tab structure with the main forecast
-    tab1, *other_tabs = st.tabs(["Main Forecast"] + list(dict_component_charts.keys()))
-    with tab1:
-        st.altair_chart(chart_forecast, use_container_width=True)
-        st.write("This chart shows the main forecast values along with confidence intervals.")
-
-    for component_name, chart in dict_component_charts.items():
-        with other_tabs[list(dict_component_charts.keys()).index(component_name)]:
-            #provide explanation of component
-            st.write(dict_of_explanations_for_charts[component_name])
-            #render the component chart
-            st.altair_chart(chart, use_container_width=True)
-
-    #--------------------------------------------
-    #--------------------------------------------
-    
-
-    if dict_params['num_appts_per_patient'] == "Single appt per patient":
-        #isolate the forecast values to derive the demand value at the user-provided percentile value
-        forecasted_values_only_yhat = forecast[forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['yhat'].values
-        forecasted_values_only_yhat_upper = forecast[forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['yhat_upper'].values
-        forecasted_values_only_yhat_lower = forecast[forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['yhat_lower'].values
-
-        #calculate the demand and confidence interval at the given threshold values
-        demand_threshold = np.percentile(forecasted_values_only_yhat, dict_params['demand_percentile'])
-        demand_threshold_upper = np.percentile(forecasted_values_only_yhat_upper, dict_params['demand_percentile'])
-        demand_threshold_lower = np.percentile(forecasted_values_only_yhat_lower, dict_params['demand_percentile'])
-    else:
-        adjusted_forecast = forecast_functions.adjust_forecast_for_appointments(
-            df_outliers_and_missing_values_interpolated,
-            forecast,
-            dict_params['average_appointments_per_pt'],
-            dict_params['dna_rate'] / 100,
-            dict_params['dna_policy_used'],
-            dict_params['max_num_dnas'],
-            dict_params['unit_of_measurement']
-        )
-        
-        #isolate the forecast values to derive the demand value at the user-provided percentile value
-        forecasted_values_only_yhat = adjusted_forecast[adjusted_forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['final_adjusted_demand'].values
-        forecasted_values_only_yhat_upper = adjusted_forecast[adjusted_forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['final_adjusted_demand_upper'].values
-        forecasted_values_only_yhat_lower = adjusted_forecast[adjusted_forecast[dict_params['datetime_field']] > df_outliers_and_missing_values_interpolated[dict_params['datetime_field']].max()]['final_adjusted_demand_lower'].values
-
-    #calculate the demand and confidence interval at the given threshold values
-    demand_threshold = np.percentile(forecasted_values_only_yhat, dict_params['demand_percentile'])
-    demand_threshold_upper = np.percentile(forecasted_values_only_yhat_upper, dict_params['demand_percentile'])
-    demand_threshold_lower = np.percentile(forecasted_values_only_yhat_lower, dict_params['demand_percentile'])
-
-    percentile_value_last_character = int(str(round(dict_params["demand_percentile"]*100,))[-1])
-    if percentile_value_last_character in [0, 4, 5, 6, 7, 8, 9]:
-        ending = 'th'
-    elif percentile_value_last_character in [1]:
-        ending = 'st'
-    elif percentile_value_last_character in [2]:
-        ending = 'nd'
-    elif percentile_value_last_character in [3]:
-        ending = 'rd'
-    else:
-        pass
-
-    percentile_text = str(round(dict_params["demand_percentile"]*100,))+ending
-
-    st.subheader(f':green[Forecast demand at {percentile_text} percentile]')
-    st.write(f"""At a :green[**{dict_params['confidence_limit']*100}%**] confidence interval, the 
-    :green[**{percentile_text}**] percentile of demand would be :green[**{round(demand_threshold,1)}**] 
-    (:green[**{round(demand_threshold_lower,1)}**] to :green[**{round(demand_threshold_upper,1)}**])""")
-
-    with st.expander(label='Click to view model output'):
-        st.write(forecast)
\ No newline at end of file
+import io
+import streamlit as st
+import pandas as pd
+from prophet import Prophet
+import matplotlib.pyplot as plt
+
+#import modules
+from functions import sidebar
+from functions import detect_outliers as outliers
+from functions import plots
+from functions import render_warnings
+from functions import forecast_functions
+from functions import run_store
+from functions import validate_data
+from functions import features
+from functions import export
+from functions import capacity
+from functions import profiling
+from functions import history_window
+from functions import fit_controls
+
+st.set_page_config(layout='wide', initial_sidebar_state='expanded')
+
+#render the sidebar by calling the relevant function
+#This will return all parameters as a dictionary
+#try:
+#    dict_params = sidebar.render_sidebar()
+#except:
+#    st.stop()
+
+
+
+st.title(':green[Demand forecasting]')
+
+st.subheader(':green[How to get started:]')
+with st.expander(label='Click for overview'):
+    st.subheader('Purpose:')
+    st.write('This app is intended to support demand and capacity planning. It uses the Meta Prophet library to do this.')
+    st.subheader('Getting started')
+    st.write('To get started, set up the parameters for your demand forecasting model using the options in the sidebar 👈🏻. Once you are happy with the parameter selections, press "Run model" button.')
+
+try:
+    dict_params = sidebar.render_sidebar()
+    #test print for model params - remove in final
+    #st.write(dict_params)
+except:
+    render_warnings.render_warning_aggregate_activity_count()
+    st.write('Please select the file you wish to use, using the "Browse files" button in the sidebar to the left 👈🏻')
+    st.stop()
+
+#time each stage of this run, so slow stages show up under load
+profiling.reset_stage_timings()
+
+#parse and check the uploaded data once, before any model work
+with profiling.time_stage('validate'):
+    dict_params['df'], dict_validation_report = validate_data.validate_and_parse_cached(
+        dict_params['df'],
+        dict_params['datetime_field'],
+        dict_params['activity_count_field']
+        )
+render_warnings.render_validation_report(dict_validation_report)
+if len(dict_validation_report['errors']) > 0:
+    st.stop()
+
+st.subheader(':green[Preview of your data set]')
+with st.expander('Click to view your data set'):
+    st.dataframe(dict_params['df'])
+
+#add button to run the model
+with st.sidebar:
+    button_run_model = st.button(label='Run model')
+
+#fingerprint the inputs before outlier handling modifies the data, and skip the
+#refit if this series has already been run on the same data with the same settings
+existing_run_id = None
+if button_run_model:
+    input_fingerprint = run_store.fingerprint_inputs(dict_params['df'], dict_params['datetime_field'], dict_params['activity_count_field'])
+    existing_run_id = run_store.find_run(dict_params['series_name'], input_fingerprint, dict_params)
+    if existing_run_id is not None:
+        st.info(f"""The data and model settings are unchanged since run :green[**{existing_run_id}**], 
+        so it has been reopened under Previous runs below rather than refitted. Change a setting to refit.""", icon='ℹ️')
+        st.session_state['reopen_run_id'] = existing_run_id
+
+        #plan capacity from the stored forecast
+        df_existing_future = run_store.future_forecast(run_store.load_run(existing_run_id))
+        demand_column = 'final_adjusted_demand' if 'final_adjusted_demand' in df_existing_future.columns else 'yhat'
+        st.session_state['capacity_demand'] = capacity.prepare_demand(df_existing_future[demand_column].values)
+        st.session_state['capacity_future_dates'] = df_existing_future['ds'].values
+        st.session_state['capacity_series_name'] = dict_params['series_name']
+
+#button_run_model = True
+if button_run_model and existing_run_id is None:
+
+    st.subheader(':green[Outlier detection and interpolation]')
+
+    #ID outliers
+    with profiling.time_stage('outliers'):
+        outlier_results = outliers.detect_outliers(
+            dict_params['df'], 
+            method=dict_params['outlier_detection_method'], 
+            threshold=dict_params['outlier_detection_method_threshold']
+            ) 
+
+    #st.write(outlier_results)
+
+    #function call to check presence of outliers using user method, render findings and 
+    #advise user what they should do if outliers present
+    #if outliers were detected and removed, advise the user of the number of outliers removed
+    #and confirm the method applied to handle the gaps in data
+    #similarly, advise if any data missing, volume of this, and method applied. 
+    with profiling.time_stage('outliers'):
+        df_outliers_and_missing_values_interpolated = outliers.process_and_visualize_outliers(
+            dict_params['df'], 
+            outlier_results, 
+            dict_params['datetime_field'], 
+            dict_params['activity_count_field'],
+            dict_params['outlier_handling_method_argument'],
+            dict_params['outlier_handling_method'],
+            dict_params['dict_unit_text_to_parameter_term'],
+            dict_params['polynomial_degree_value']
+            )
+
+
+    #look for shifts in the level of demand, and fit only on the history since the latest if asked
+    if dict_params['history_window_mode'] != 'Full history':
+        st.subheader(':green[History window]')
+        with profiling.time_stage('history_window'):
+            dict_window = history_window.suggest_history_window(
+                df_outliers_and_missing_values_interpolated,
+                'ds',
+                'y',
+                dict_params['unit_of_measurement']
+                )
+
+        if len(dict_window['changepoint_dates']) > 0:
+            st.write(f"""Found :green[**{len(dict_window['changepoint_dates'])}**] shift(s) in the level of demand, 
+            the latest on :green[**{dict_window['changepoint_dates'][-1]:%d %B %Y}**].""")
+        else:
+            st.write('No shift in the level of demand was found.')
+        st.write(f"""Suggested window: the :green[**{dict_window['num_rows_window']}**] of {dict_window['num_rows_full']} 
+        {dict_params['unit_of_measurement']}s from :green[**{dict_window['window_start']:%d %B %Y}**].""")
+        st.altair_chart(plots.plot_history_window(df_outliers_and_missing_values_interpolated, dict_window), use_container_width=True)
+
+        if dict_params['history_window_backtest'] and dict_window['num_rows_window'] == dict_window['num_rows_full']:
+            st.write('The suggested window is the full history, so there is nothing to backtest.')
+        elif dict_params['history_window_backtest']:
+            with st.spinner('Backtesting the suggested window against the full history...'), profiling.time_stage('history_window_backtest'):
+                df_backtest = history_window.backtest_history_window(
+                    df_outliers_and_missing_values_interpolated,
+                    dict_window['window_start'],
+                    dict_params
+                    )
+            st.dataframe(df_backtest, use_container_width=True)
+            st.write(f"""Fitting on the suggested window took :green[**{df_backtest.loc['Suggested window', 'fit_seconds']:.2f}s**] 
+            against :green[**{df_backtest.loc['Full history', 'fit_seconds']:.2f}s**] for the full history. 
+            Forecasting the last {df_backtest['holdout_periods'].iloc[0]} {dict_params['unit_of_measurement']}s with a window 
+            suggested from the earlier periods only (from {df_backtest.loc['Suggested window', 'window_start']:%d %b %Y}), it was out by 
+            :green[**{df_backtest.loc['Suggested window', 'wape']:.1%}**] of demand against 
+            :green[**{df_backtest.loc['Full history', 'wape']:.1%}**] for the full history.""")
+
+        if dict_params['history_window_mode'] == 'Apply suggested window':
+            df_outliers_and_missing_values_interpolated = history_window.apply_history_window(
+                df_outliers_and_missing_values_interpolated,
+                'ds',
+                dict_window['window_start']
+                )
+            st.write('The model below is fitted on the suggested window.')
+
+    st.subheader(':green[Fitting the model]')
+    #create the model
+    model = Prophet(interval_width=dict_params['confidence_limit'])
+
+    #add any holiday / external regressor features. These are computed once per
+    #calendar and date range and cached, then joined onto the history and each future chunk
+    with profiling.time_stage('features'):
+        try:
+            feature_set = forecast_functions.build_feature_set_for_params(df_outliers_and_missing_values_interpolated, dict_params)
+        except ValueError as error:
+            st.error(str(error))
+            st.stop()
+        if feature_set is not None:
+            df_outliers_and_missing_values_interpolated = features.add_features(df_outliers_and_missing_values_interpolated, feature_set)
+            for column in feature_set['columns']:
+                model.add_regressor(column)
+
+    #fit the model to the dataset, starting from the last fit in this session if asked
+    with profiling.time_stage('fit'):
+        dict_fit_diagnostics = fit_controls.fit_model(
+            model,
+            df_outliers_and_missing_values_interpolated,
+            dict_params,
+            previous_params=st.session_state.get('previous_fit_params')
+            )
+    dict_warm_start = fit_controls.extract_warm_start(model)
+    if dict_warm_start is not None:
+        st.session_state['previous_fit_params'] = dict_warm_start
+
+    if not dict_fit_diagnostics['converged']:
+        st.warning(f"The optimizer did not converge ({dict_fit_diagnostics['message']}). Try more iterations or another optimizer under 'Fitting settings'.", icon='⚠️')
+    with st.expander(label='Click to view fit diagnostics'):
+        st.write(f"""Fitted with :green[**{dict_fit_diagnostics['algorithm_used']}**] from the 
+        :green[**{dict_fit_diagnostics['init'].lower()}**] start in :green[**{dict_fit_diagnostics['iterations']}**] iterations, 
+        taking :green[**{dict_fit_diagnostics['total_seconds']:.2f}s**] ({dict_fit_diagnostics['cmdstan_seconds']:.2f}s in cmdstan, 
+        {dict_fit_diagnostics['python_seconds']:.2f}s in Python).""")
+        st.dataframe(pd.DataFrame([dict_fit_diagnostics]), use_container_width=True)
+
+    #Make future predictions
+    #the horizon is predicted in chunks so memory stays bounded for long horizons.
+    #forecast holds the fitted history plus a downsampled view of the future
+    #every future row is streamed into the run store as it is predicted, and exported from there
+    run_writer = run_store.RunForecastWriter()
+    try:
+        with profiling.time_stage('predict'):
+            forecast, dict_threshold_values = forecast_functions.predict_in_chunks(
+                model,
+                df_outliers_and_missing_values_interpolated,
+                dict_params,
+                chunk_size=dict_params['predict_chunk_size'],
+                max_display_rows=dict_params['max_display_rows'],
+                feature_set=feature_set,
+                on_chunk=run_writer.write
+                )
+
+        #the future values (adjusted for appointments / DNAs where a multiple appt service)
+        #were accumulated chunk by chunk during prediction
+        #calculate the demand and confidence interval at the given threshold values
+        dict_thresholds = forecast_functions.calculate_demand_thresholds(dict_threshold_values, dict_params['demand_percentile'])
+
+        #record the run so it can be reopened, compared and exported without refitting.
+        #the full future is already in the run's file, only the fitted history is added
+        with profiling.time_stage('save_run'):
+            run_id = run_store.save_run(
+                dict_params['series_name'],
+                input_fingerprint,
+                dict_params,
+                forecast[forecast['ds'] <= df_outliers_and_missing_values_interpolated['ds'].max()],
+                dict_thresholds,
+                df_cleaned=df_outliers_and_missing_values_interpolated,
+                forecast_writer=run_writer
+                )
+    finally:
+        #a run that failed before it was saved leaves no partial file in the store
+        run_writer.discard()
+
+    with profiling.time_stage('plots'):
+        chart_forecast = plots.plot_forecast_with_components(df_outliers_and_missing_values_interpolated, forecast, dict_params['datetime_field'])
+
+    #render the chart
+    #st.altair_chart(chart_forecast, use_container_width=True)
+
+
+    #get model components (Charts and explanations)
+    with profiling.time_stage('plots'):
+        dict_component_charts, dict_of_explanations_for_charts = plots.create_dict_of_component_charts(dict_params['datetime_field'], forecast)
+
+    #set up the tabs to render all outputs
+    # Begin a tab structure with the main forecast
+    tab1, *other_tabs = st.tabs(["Main Forecast"] + list(dict_component_charts.keys()))
+    with tab1:
+        st.altair_chart(chart_forecast, use_container_width=True)
+        st.write("This chart shows the main forecast values along with confidence intervals.")
+
+    for component_name, chart in dict_component_charts.items():
+        with other_tabs[list(dict_component_charts.keys()).index(component_name)]:
+            #provide explanation of component
+            st.write(dict_of_explanations_for_charts[component_name])
+            #render the component chart
+            st.altair_chart(chart, use_container_width=True)
+
+    #--------------------------------------------
+    #--------------------------------------------
+    
+
+    demand_threshold = dict_thresholds['demand_threshold']
+    demand_threshold_upper = dict_thresholds['demand_threshold_upper']
+    demand_threshold_lower = dict_thresholds['demand_threshold_lower']
+
+    percentile_text = forecast_functions.format_percentile(dict_params['demand_percentile'])
+
+    st.subheader(f':green[Forecast demand at {percentile_text} percentile]')
+    st.write(f"""At a :green[**{dict_params['confidence_limit']*100}%**] confidence interval, the 
+    :green[**{percentile_text}**] percentile of demand would be :green[**{round(demand_threshold,1)}**] 
+    (:green[**{round(demand_threshold_lower,1)}**] to :green[**{round(demand_threshold_upper,1)}**])""")
+
+    with st.expander(label='Click to view model output'):
+        st.dataframe(forecast[[column for column in st.session_state.get('export_columns', export.DEFAULT_EXPORT_COLUMNS) if column in forecast.columns]], use_container_width=True)
+
+    #download the full forecast and the threshold summary
+    file_extension = export.EXPORT_FORMATS[dict_params['export_format']]['extension']
+    summary_buffer = io.BytesIO()
+    export.export_frame(
+        export.create_threshold_summary(dict_params, dict_thresholds),
+        summary_buffer,
+        dict_params['export_format'],
+        sheet_name='summary'
+        )
+    col1, col2 = st.columns(2)
+    with col1:
+        #exported from the run store, so the file matches a download of this run under Previous runs
+        st.download_button(
+            label='Download forecast',
+            data=export.export_stored_forecast_cached(
+                run_writer.path,
+                dict_params['export_format'],
+                columns=st.session_state.get('export_columns', export.DEFAULT_EXPORT_COLUMNS),
+                after_date=df_outliers_and_missing_values_interpolated['ds'].max(),
+                series_name=dict_params['series_name']
+                ),
+            file_name=f'forecast.{file_extension}',
+            mime=export.EXPORT_FORMATS[dict_params['export_format']]['mime']
+            )
+    with col2:
+        st.download_button(
+            label='Download demand threshold summary',
+            data=summary_buffer.getvalue(),
+            file_name=f'demand_threshold_summary.{file_extension}',
+            mime=export.EXPORT_FORMATS[dict_params['export_format']]['mime']
+            )
+
+    st.write(f'This run has been saved with id :green[**{run_id}**].')
+    st.session_state['reopen_run_id'] = run_id
+
+    #keep the forecast demand for the capacity planner, so it survives reruns
+    st.session_state['capacity_demand'] = capacity.prepare_demand(dict_threshold_values['yhat'])
+    st.session_state['capacity_future_dates'] = dict_threshold_values['ds']
+    st.session_state['capacity_series_name'] = dict_params['series_name']
+
+#--------------------------------------------
+#turn the forecast demand into clinic sessions, clinician hours and slots
+if 'capacity_demand' in st.session_state:
+    st.subheader(':green[Capacity planning]')
+    capacity.render_capacity_planner(
+        st.session_state['capacity_demand'],
+        [st.session_state['capacity_series_name']],
+        st.session_state['capacity_future_dates'],
+        dict_params['demand_percentile'],
+        dict_params['unit_of_measurement'],
+        dna_rate=dict_params['dna_rate'] / 100,
+        #a multiple appt service's demand already has DNAs taken out
+        demand_net_of_dnas=dict_params['num_appts_per_patient'] != 'Single appt per patient'
+        )
+
+#--------------------------------------------
+#previously saved runs for the selected series
+df_previous_runs = run_store.list_runs(series_name=dict_params['series_name'])
+if len(df_previous_runs) > 0:
+    st.subheader(':green[Previous runs]')
+    with st.expander(label='Click to compare, reopen and download previous runs of this series'):
+        st.dataframe(df_previous_runs, use_container_width=True)
+        list_run_ids = list(df_previous_runs['run_id'])
+        reopen_run_id = st.session_state.get('reopen_run_id')
+        selected_run_id = st.selectbox(
+            label='Select a run to reopen',
+            options=list_run_ids,
+            index=list_run_ids.index(reopen_run_id) if reopen_run_id in list_run_ids else 0
+            )
+        dict_previous_run = run_store.load_run(selected_run_id)
+        if dict_previous_run['data'] is not None:
+            #the stored forecast covers the full horizon, so thin the future for the chart as the run did
+            df_previous_future = run_store.future_forecast(dict_previous_run)
+            display_step = max(-(-len(df_previous_future) // dict_params['max_display_rows']), 1)
+            df_previous_display = pd.concat([
+                dict_previous_run['forecast'].iloc[:len(dict_previous_run['forecast']) - len(df_previous_future)],
+                df_previous_future.iloc[::display_step]
+                ], ignore_index=True)
+            st.altair_chart(
+                plots.plot_forecast_with_components(dict_previous_run['data'], df_previous_display, dict_previous_run['params']['datetime_field']),
+                use_container_width=True
+                )
+
+        #offer the columns this run's model produced (including any holiday and regressor
+        #components), and keep the choice for the next new run's download
+        list_export_options = ['series_name'] + list(dict_previous_run['forecast'].columns)
+        st.session_state['export_columns'] = st.multiselect(
+            label='Columns to export',
+            options=list_export_options,
+            default=[column for column in export.DEFAULT_EXPORT_COLUMNS if column in list_export_options]
+            )
+        #only the future periods are exported, as for a new run. Stored runs never change,
+        #so each run is exported once per format and column choice, not on every rerun
+        st.download_button(
+            label=f"Download forecast as {dict_params['export_format']}",
+            data=export.export_stored_forecast_cached(
+                dict_previous_run['forecast_path'],
+                dict_params['export_format'],
+                columns=st.session_state['export_columns'],
+                after_date=dict_previous_run['data']['ds'].max() if dict_previous_run['data'] is not None else None,
+                series_name=dict_previous_run['series_name']
+                ),
+            file_name=f"forecast_{selected_run_id}.{export.EXPORT_FORMATS[dict_params['export_format']]['extension']}",
+            mime=export.EXPORT_FORMATS[dict_params['export_format']]['mime']
+            )
\ No newline at end of file
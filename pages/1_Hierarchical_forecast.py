@@ -0,0 +1,199 @@
+import io
+import streamlit as st
+import pandas as pd
+import altair as alt
+
+#import modules
+from functions import capacity
+from functions import create_dummy_data
+from functions import export
+from functions import forecast_functions
+from functions import hierarchy
+from functions import fit_controls
+from functions import sidebar
+from functions import validate_data
+
+st.set_page_config(layout='wide', initial_sidebar_state='expanded')
+
+st.title(':green[Hierarchical demand forecasting]')
+
+st.subheader(':green[How to get started:]')
+with st.expander(label='Click for overview'):
+    st.subheader('Purpose:')
+    st.write("""Forecasts demand at every level of a service hierarchy (e.g. clinic, specialty and trust)
+    so that the levels add up. Each series is forecast with the same Prophet model as the main page,
+    then the forecasts are reconciled across the hierarchy.""")
+    st.subheader('Getting started')
+    st.write("""Upload a file of activity counts per date for each bottom level series (e.g. clinic), and a
+    hierarchy file with one row per bottom level series and one column per level, from the top level down
+    (e.g. trust, specialty, clinic). Then press "Run model" in the sidebar 👈🏻.""")
+    st.subheader('Reconciliation methods')
+    st.write("""**Bottom-up** forecasts only the bottom level and adds it up. **OLS** forecasts every level
+    and adjusts them all equally so they add up. **MinT (diagonal)** also forecasts every level, but trusts
+    the levels the model fits best the most.""")
+
+with st.sidebar:
+    st.subheader('Select data source')
+    with st.expander('File upload'):
+        use_dummy_data = st.radio(label='Use test data to preview functionality?', options=['Yes', 'No'], horizontal=True, index=0)
+        if use_dummy_data == 'Yes':
+            df_long, df_hierarchy = create_dummy_data.create_hierarchical_data()
+        else:
+            data_path = st.file_uploader(label='Activity by bottom level series')
+            hierarchy_path = st.file_uploader(label='Hierarchy')
+            if data_path is None or hierarchy_path is None:
+                st.write('Please select both files.')
+                st.stop()
+            df_long = pd.read_csv(data_path)
+            df_hierarchy = pd.read_csv(hierarchy_path)
+
+    with st.popover('Set columns'):
+        datetime_field = st.selectbox(label='Select the date/time field', options=list(df_long.columns))
+        series_field = st.selectbox(label='Select the field naming the bottom level series', options=list(df_long.columns), index=1)
+        activity_count_field = st.selectbox(label='Select the field containing activity counts', options=list(df_long.columns), index=2)
+        level_columns = st.multiselect(
+            label='Hierarchy levels, from the top level down',
+            options=list(df_hierarchy.columns),
+            default=list(df_hierarchy.columns),
+            help='The last level must hold the same names as the bottom level series field.')
+        unit_of_measurement = st.selectbox(label='What is the unit of measurement', options=list(sidebar.dict_unit_text_to_parameter_term.keys()), index=4)
+
+    st.subheader('Reconciliation')
+    reconciliation_method = st.radio(label='Reconciliation method', options=hierarchy.RECONCILIATION_METHODS, index=2)
+    max_workers = st.number_input(label='Number of series to fit at once', min_value=1, max_value=32, value=4)
+    with st.popover('Fitting settings'):
+        optimizer_algorithm = st.radio(label='Optimizer', options=fit_controls.OPTIMIZER_ALGORITHMS, horizontal=True)
+        optimizer_iter = st.number_input(label='Max. optimizer iterations', min_value=10, value=fit_controls.DEFAULT_ITER, step=100)
+        optimizer_tol_rel_grad = st.number_input(
+            label='Relative gradient tolerance', min_value=1.0, value=fit_controls.DEFAULT_TOL_REL_GRAD, format='%.0e',
+            help='Not used by Newton.')
+        #each node is fitted once, so there is no previous fit to start from
+        fit_init = st.radio(label='Start the fit from', options=fit_controls.INIT_METHODS[:2])
+
+    st.subheader('Set demand theshold')
+    demand_percentile = st.slider(
+        label='What percentage of the time do you want to have enough capacity?',
+        min_value=1, max_value=100, step=1, value=85) / 100
+
+    st.subheader('Set forecast horizon')
+    forecast_horizon = st.number_input(label=f"How many :green[**{unit_of_measurement}s**] should the forecast consist of?", min_value=1, value=30)
+
+    st.subheader('Confidence limits')
+    confidence_limit = st.radio(label='Set the confidence interval for the model', options=[0.9, 0.95, 0.99], index=1, horizontal=True, format_func=lambda value: f'{round(value * 100)}%')
+
+    button_run_model = st.button(label='Run model')
+
+if len(level_columns) == 0:
+    st.write('Please select the hierarchy levels under "Set columns" in the sidebar 👈🏻')
+    st.stop()
+
+st.subheader(':green[Preview of your data set]')
+with st.expander('Click to view your data set'):
+    st.dataframe(df_long, use_container_width=True)
+    st.dataframe(df_hierarchy, use_container_width=True)
+
+if button_run_model:
+    #parse the dates once and coerce the counts to numbers
+    df_long = df_long.copy()
+    if not pd.api.types.is_datetime64_any_dtype(df_long[datetime_field]):
+        datetime_format = validate_data.infer_datetime_format(df_long[datetime_field])
+        if datetime_format is None:
+            st.error(f"Could not recognise a single date format in '{datetime_field}'.")
+            st.stop()
+        df_long[datetime_field] = pd.to_datetime(df_long[datetime_field], format=datetime_format, errors='coerce')
+    df_long[activity_count_field] = pd.to_numeric(df_long[activity_count_field], errors='coerce')
+
+    missing_series = set(df_hierarchy[level_columns[-1]].astype(str)) - set(df_long[series_field].astype(str))
+    if len(missing_series) > 0:
+        st.warning(f"{len(missing_series)} bottom level series in the hierarchy have no activity and will be forecast as zero.", icon='⚠️')
+
+    dict_params = {
+        **forecast_functions.DEFAULT_PARAMS,
+        'datetime_field': datetime_field,
+        'activity_count_field': activity_count_field,
+        'unit_of_measurement': unit_of_measurement,
+        'dict_unit_text_to_parameter_term': sidebar.dict_unit_text_to_parameter_term[unit_of_measurement],
+        'demand_percentile': demand_percentile,
+        'forecast_horizon': int(forecast_horizon),
+        'confidence_limit': confidence_limit,
+        'optimizer_algorithm': optimizer_algorithm,
+        'optimizer_iter': int(optimizer_iter),
+        'optimizer_tol_rel_grad': float(optimizer_tol_rel_grad),
+        'fit_init': fit_init,
+    }
+
+    with st.spinner('Forecasting and reconciling every level of the hierarchy...'):
+        st.session_state['hierarchy_results'] = hierarchy.run_hierarchical_forecast(
+            df_long,
+            df_hierarchy,
+            level_columns,
+            series_field,
+            dict_params,
+            method=reconciliation_method,
+            max_workers=int(max_workers)
+            )
+        st.session_state['hierarchy_percentile'] = demand_percentile
+        st.session_state['hierarchy_unit'] = unit_of_measurement
+        st.session_state['hierarchy_capacity_demand'] = capacity.prepare_demand(st.session_state['hierarchy_results']['yhat'])
+
+#results are kept in the session so other nodes can be viewed without refitting
+if 'hierarchy_results' in st.session_state:
+    dict_results = st.session_state['hierarchy_results']
+    df_thresholds = dict_results['thresholds']
+
+    st.subheader(f":green[Forecast demand at the {forecast_functions.format_percentile(st.session_state['hierarchy_percentile'])} percentile, by level]")
+    st.dataframe(df_thresholds, use_container_width=True)
+    st.caption("""Forecasts add up across the hierarchy. The lower and upper values do not: each node's interval 
+    comes from its own model (for bottom-up, from the series below it assuming their errors are independent), 
+    as adding up the intervals below a node would overstate its uncertainty. A node with a 'same_as' value covers 
+    the same series as that node, so shares its forecast.""")
+
+    summary_buffer = io.BytesIO()
+    export.export_frame(df_thresholds, summary_buffer, 'CSV')
+    st.download_button(label='Download demand thresholds', data=summary_buffer.getvalue(), file_name='hierarchy_demand_thresholds.csv', mime='text/csv')
+
+    #slow or unconverged fits point at series that need a closer look
+    df_fit_diagnostics = dict_results['fit_diagnostics']
+    num_not_converged = int((~df_fit_diagnostics['converged']).sum())
+    if num_not_converged > 0:
+        st.warning(f'The optimizer did not converge for {num_not_converged} of {len(df_fit_diagnostics)} fitted series.', icon='⚠️')
+    with st.expander(label='Click to view fit diagnostics'):
+        st.dataframe(df_fit_diagnostics.sort_values('total_seconds', ascending=False), use_container_width=True)
+
+    selected_node = st.selectbox(label='Select a node to view', options=list(df_thresholds['node']))
+    node_position = list(df_thresholds['node']).index(selected_node)
+
+    df_node_history = pd.DataFrame({'ds': dict_results['dates'], 'y': dict_results['history'][node_position]})
+    df_node_forecast = pd.DataFrame({
+        'ds': dict_results['future_dates'],
+        'yhat': dict_results['yhat'][node_position],
+        'yhat_lower': dict_results['yhat_lower'][node_position],
+        'yhat_upper': dict_results['yhat_upper'][node_position],
+    })
+
+    chart_history = alt.Chart(df_node_history).mark_line(color='lightgrey').encode(
+        x=alt.X('ds:T', title='Date'),
+        y=alt.Y('y:Q', title='Demand'),
+        tooltip=['ds', 'y']
+    )
+    chart_forecast = alt.Chart(df_node_forecast).mark_line(color='green').encode(
+        x='ds:T',
+        y='yhat:Q',
+        tooltip=['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+    )
+    chart_uncertainty = alt.Chart(df_node_forecast).mark_area(opacity=0.3, color='lightgreen').encode(
+        x='ds:T',
+        y='yhat_lower:Q',
+        y2='yhat_upper:Q'
+    )
+    st.altair_chart(alt.layer(chart_history, chart_uncertainty, chart_forecast).interactive(), use_container_width=True)
+
+    #capacity for every node at once
+    st.subheader(':green[Capacity planning]')
+    capacity.render_capacity_planner(
+        st.session_state['hierarchy_capacity_demand'],
+        list(df_thresholds['node']),
+        dict_results['future_dates'],
+        st.session_state['hierarchy_percentile'],
+        st.session_state['hierarchy_unit']
+        )
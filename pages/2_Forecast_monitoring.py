@@ -0,0 +1,96 @@
+import io
+import streamlit as st
+import pandas as pd
+
+#import modules
+from functions import accuracy_monitor
+from functions import create_dummy_data
+from functions import export
+from functions import validate_data
+
+st.set_page_config(layout='wide', initial_sidebar_state='expanded')
+
+st.title(':green[Forecast monitoring]')
+
+st.subheader(':green[How to get started:]')
+with st.expander(label='Click for overview'):
+    st.subheader('Purpose:')
+    st.write("""Checks forecasts against what actually happened, so drift is spotted early. New actuals are
+    matched to the latest saved run of the same series, and each series' error, bias and interval coverage
+    are kept up to date as actuals arrive.""")
+    st.subheader('Getting started')
+    st.write("""Upload a file of actuals with a column naming the series (the name the forecast was saved
+    under, e.g. the uploaded file name), a date column and an activity count column. Then press
+    "Score new actuals" in the sidebar 👈🏻. Actuals already scored are skipped, so the same file can be
+    uploaded again as it grows.""")
+    st.subheader('Reading the results')
+    st.write("""**Rolling** statistics weight recent periods most. A series is **flagged** when demand has
+    been above its planned threshold more often than planned - e.g. more than 15% of the time for a
+    threshold set at the 85th percentile.""")
+
+with st.sidebar:
+    st.subheader('Select actuals')
+    with st.expander('File upload'):
+        use_dummy_data = st.radio(label='Use test data to preview functionality?', options=['Yes', 'No'], horizontal=True, index=0)
+        if use_dummy_data == 'Yes':
+            df_actuals = create_dummy_data.create_actuals(num_history_days=st.session_state.get('test_data_num_days', 3*365))
+        else:
+            actuals_path = st.file_uploader(label='Actuals')
+            if actuals_path is None:
+                st.write('Please select a file.')
+                st.stop()
+            df_actuals = pd.read_csv(actuals_path)
+
+    with st.popover('Set columns'):
+        series_field = st.selectbox(label='Select the field naming the series', options=list(df_actuals.columns))
+        datetime_field = st.selectbox(label='Select the date/time field', options=list(df_actuals.columns), index=1)
+        activity_count_field = st.selectbox(label='Select the field containing activity counts', options=list(df_actuals.columns), index=2)
+
+    st.subheader('Rolling statistics')
+    halflife = st.number_input(
+        label='Periods for the weight of an error to halve',
+        min_value=1, value=accuracy_monitor.ROLLING_HALFLIFE,
+        help='Lower values make the rolling statistics follow recent periods more closely. Applies to actuals scored from now on.')
+
+    button_score_actuals = st.button(label='Score new actuals')
+
+st.subheader(':green[Preview of your actuals]')
+with st.expander('Click to view your actuals'):
+    st.dataframe(df_actuals, use_container_width=True)
+
+if button_score_actuals:
+    df_actuals = pd.DataFrame({
+        'series_name': df_actuals[series_field].astype(str),
+        'ds': df_actuals[datetime_field],
+        'y': pd.to_numeric(df_actuals[activity_count_field], errors='coerce'),
+    })
+    if not pd.api.types.is_datetime64_any_dtype(df_actuals['ds']):
+        datetime_format = validate_data.infer_datetime_format(df_actuals['ds'])
+        if datetime_format is None:
+            st.error(f"Could not recognise a single date format in '{datetime_field}'.")
+            st.stop()
+        df_actuals['ds'] = pd.to_datetime(df_actuals['ds'], format=datetime_format, errors='coerce')
+
+    with st.spinner('Scoring actuals against the saved forecasts...'):
+        df_summary, num_scored, num_unmatched = accuracy_monitor.update_accuracy(df_actuals, halflife=halflife)
+    st.write(f'Scored :green[**{num_scored}**] new actuals.')
+    if num_unmatched > 0:
+        st.warning(f'{num_unmatched} actuals could not be scored, as the latest saved forecast of their series has no period on their date (e.g. they are past the forecast horizon) or their series has no saved forecast.', icon='⚠️')
+else:
+    df_summary = accuracy_monitor.summarise_accuracy(accuracy_monitor.load_state())
+
+if len(df_summary) == 0:
+    st.write('No forecasts have been scored yet. Save a forecast on the main page, then score actuals for it here.')
+    st.stop()
+
+num_flagged = int(df_summary['flag_over_threshold'].sum())
+st.subheader(':green[Forecast accuracy]')
+if num_flagged > 0:
+    st.warning(f'{num_flagged} of {len(df_summary)} monitored series have been above their planned demand threshold more often than planned.', icon='⚠️')
+else:
+    st.write(f'None of the {len(df_summary)} monitored series have been above their planned demand threshold more often than planned.')
+st.dataframe(df_summary, use_container_width=True)
+
+summary_buffer = io.BytesIO()
+export.export_frame(df_summary, summary_buffer, 'CSV')
+st.download_button(label='Download forecast accuracy', data=summary_buffer.getvalue(), file_name='forecast_accuracy.csv', mime='text/csv')
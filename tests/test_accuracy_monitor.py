@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from functions import accuracy_monitor
+from functions import forecast_functions
+from functions import run_store
+
+#---------------------------------------
+
+def save_test_run(store_dir, series_name, yhat, dict_params, threshold_scale=1.0):
+    # Store a run with the given future forecast after a year of history.
+    # threshold_scale puts the stored thresholds in other units, as for a multiple appt service
+    history_dates = pd.date_range('2021-01-01', periods=365, freq='D')
+    future_dates = pd.date_range(history_dates[-1] + pd.Timedelta(days=1), periods=len(yhat), freq='D')
+    df_forecast = pd.DataFrame({'ds': future_dates, 'yhat': yhat, 'yhat_lower': yhat - 10, 'yhat_upper': yhat + 10})
+    dict_thresholds = forecast_functions.calculate_demand_thresholds(df_forecast, dict_params['demand_percentile'])
+    dict_thresholds = {key: value * threshold_scale for key, value in dict_thresholds.items()}
+    return run_store.save_run(
+        series_name,
+        series_name,
+        dict_params,
+        df_forecast,
+        dict_thresholds,
+        df_cleaned=pd.DataFrame({'ds': history_dates, 'y': 50.0}),
+        store_dir=store_dir
+        )
+
+def test_demand_from_forecast_distribution_exceeds_threshold_as_planned(tmp_path):
+    store_dir = str(tmp_path)
+    rng = np.random.default_rng(0)
+    horizon = 365
+    list_actuals = []
+    for series_number in range(20):
+        #a seasonal forecast, with actuals drawn from the forecast demand over the horizon
+        yhat = 50 + 20 * np.sin(np.arange(horizon) * 2 * np.pi / 365 + series_number) + rng.normal(0, 5, horizon)
+        series_name = f'Series {series_number}'
+        if series_number % 2 == 0:
+            dict_params = {'demand_percentile': 0.85, 'confidence_limit': 0.8, 'num_appts_per_patient': 'Single appt per patient'}
+            save_test_run(store_dir, series_name, yhat, dict_params)
+        else:
+            dict_params = {'demand_percentile': 0.85, 'confidence_limit': 0.8, 'num_appts_per_patient': 'Multiple appt per patient'}
+            save_test_run(store_dir, series_name, yhat, dict_params, threshold_scale=3.0)
+        list_actuals.append(pd.DataFrame({
+            'series_name': series_name,
+            'ds': pd.date_range('2022-01-01', periods=horizon, freq='D'),
+            'y': rng.choice(yhat, size=horizon),
+        }))
+
+    df_summary, num_scored, num_unmatched = accuracy_monitor.update_accuracy(pd.concat(list_actuals, ignore_index=True), store_dir=store_dir)
+
+    assert num_scored == 20 * horizon
+    assert num_unmatched == 0
+    #demand exceeds the planned percentile in about the planned share of periods, for
+    #single and multiple appt services alike
+    share_over_threshold = df_summary.set_index('series_name')['share_over_threshold']
+    assert abs(share_over_threshold.mean() - 0.15) < 0.02
+    assert share_over_threshold.between(0.08, 0.22).all()
+    assert np.allclose(df_summary['planned_share_over_threshold'], 0.15)
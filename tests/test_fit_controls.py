@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from functions import fit_controls
+from functions import forecast_functions
+
+#---------------------------------------
+
+def make_params(**kwargs):
+    # Default params for a headless fit, with any overrides
+    return {**forecast_functions.DEFAULT_PARAMS, **kwargs}
+
+def test_constant_series_gives_no_warm_start():
+    #Prophet skips Stan for a constant history, so its parameters are not shaped as after a fit
+    df = pd.DataFrame({'ds': pd.date_range('2022-01-01', periods=100, freq='D'), 'y': 5.0})
+    model = Prophet()
+    fit_controls.fit_model(model, df, make_params())
+    assert fit_controls.extract_warm_start(model) is None
+
+def test_warm_start_from_previous_fit():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2022-01-01', periods=200, freq='D')
+    df = pd.DataFrame({'ds': dates, 'y': 50 + 10 * np.sin(np.arange(200) * 2 * np.pi / 7) + rng.normal(0, 3, 200)})
+    model = Prophet()
+    fit_controls.fit_model(model, df, make_params())
+    dict_warm_start = fit_controls.extract_warm_start(model)
+    assert np.isfinite([dict_warm_start['k'], dict_warm_start['m'], dict_warm_start['sigma_obs']]).all()
+    assert dict_warm_start['delta'].shape == (len(model.changepoints),)
+
+    dict_diagnostics = fit_controls.fit_model(Prophet(), df, make_params(fit_init='Previous fit'), previous_params=dict_warm_start)
+    assert dict_diagnostics['converged']
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from functions import forecast_functions
+
+#---------------------------------------
+
+def make_params(**kwargs):
+    # Default params for a headless fit, with any overrides
+    return {**forecast_functions.DEFAULT_PARAMS, **kwargs}
+
+def test_mid_month_future_keeps_day_of_month():
+    last_date = pd.Timestamp('2023-06-15')
+    chunks = forecast_functions.make_future_dates_in_chunks(last_date, 14, chunk_size=5, freq='M')
+    future_dates = pd.concat(list(chunks))['ds']
+    assert len(future_dates) == 14
+    assert (future_dates.dt.day == 15).all()
+    assert future_dates.iloc[0] == pd.Timestamp('2023-07-15')
+    assert future_dates.iloc[-1] == pd.Timestamp('2024-08-15')
+
+def test_late_month_future_does_not_drift():
+    #the 30th is clipped in February only, and later months go back to the 30th
+    chunks = forecast_functions.make_future_dates_in_chunks(pd.Timestamp('2023-01-30'), 3, chunk_size=1, freq='M')
+    future_dates = list(pd.concat(list(chunks))['ds'])
+    assert future_dates == [pd.Timestamp('2023-02-28'), pd.Timestamp('2023-03-30'), pd.Timestamp('2023-04-30')]
+
+def test_month_end_future_stays_on_month_end():
+    chunks = forecast_functions.make_future_dates_in_chunks(pd.Timestamp('2023-01-31'), 3, chunk_size=2, freq='M')
+    future_dates = pd.concat(list(chunks))['ds']
+    assert future_dates.dt.is_month_end.all()
+
+def test_mid_month_forecast_aligns_with_history():
+    history_dates = pd.date_range('2018-01-15', periods=60, freq=pd.DateOffset(months=1))
+    df = pd.DataFrame({'ds': history_dates, 'y': np.random.default_rng(0).poisson(50, 60).astype(float)})
+    dict_params = make_params(unit_of_measurement='month', dict_unit_text_to_parameter_term='M', forecast_horizon=6)
+
+    model, df_cleaned, _ = forecast_functions.fit_forecast_model(df, dict_params)
+    _, dict_threshold_values = forecast_functions.predict_in_chunks(model, df_cleaned, dict_params, chunk_size=4)
+
+    future_dates = pd.DatetimeIndex(dict_threshold_values['ds'])
+    assert (future_dates.day == 15).all()
+    assert future_dates[0] == history_dates[-1] + pd.DateOffset(months=1)